@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 09:12:44 2026
+
+@author: dgill
+@description: Benchmarks for the pipeline. Each measurement runs in a fresh
+              process, so the peak RSS reported belongs to that run alone.
+              bench_pipeline runs every stage over generated data, and appends
+              the results to BENCHMARK_DIR/results.jsonl, so runs can be
+              compared over time.
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import platform
+import logging
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+import settings as st
+import setup
+import extract as e
+import instrument
+from instrument import peak_rss
+import generate
+
+log = logging.getLogger('benchmark')
+
+def _run(fn, args):
+    start = time.perf_counter()
+    rows = fn(*args)
+    seconds = time.perf_counter() - start
+    return {
+        'rows' : rows
+        ,'seconds' : seconds
+        ,'rows_per_sec' : rows / seconds if seconds > 0 else None
+        ,'peak_rss_mb' : peak_rss()
+    }
+
+def measure(fn, *args):
+    '''
+    Run fn(*args) in its own process. fn must be defined at module level, and
+    return the number of rows it processed.
+    '''
+    # The settings are copied over, so paths set at run time carry across
+    with ProcessPoolExecutor(max_workers=1, initializer=setup.apply_settings
+                             ,initargs=(setup.settings_snapshot(),)) as pool:
+        return pool.submit(_run, fn, args).result()
+
+def report(label, result):
+    print('[+] {:<12} {:>12,} rows {:>8.2f}s {:>14,.0f} rows/sec {:>10} MB peak RSS'.format(
+        label, result['rows'], result['seconds'], result['rows_per_sec'] or 0
+        ,'?' if result['peak_rss_mb'] is None else '{:,.0f}'.format(result['peak_rss_mb'])))
+
+def _read_file(path, prefix, prune):
+    return len(e.read_file(path, prefix, prune=prune))
+
+def bench_reader(path, prefix='Performance'):
+    '''
+    Compare parsing every column of a file, then slicing to SELECT, against
+    the pruned, typed reader.
+    '''
+    results = {}
+    for label, prune in [('full', False), ('pruned', True)]:
+        results[label] = measure(_read_file, path, prefix, prune)
+        report(label, results[label])
+    return results
+
+def _ingested_rows(prefix):
+    return sum(entry['rows'] for entry in e.manifest().d.values()
+               if entry['partition'].startswith(prefix + '/'))
+
+def _uzip():
+    e.uzip(remove_old=False)
+    rows = 0
+    for name in os.listdir(st.DATA_DIR):
+        if name.endswith('.txt'):
+            with open(os.path.join(st.DATA_DIR, name), 'rb') as f:
+                rows += sum(1 for _ in f)
+    return rows
+
+def _f_concat(prefix):
+    e.f_concat(prefix, incremental=False)
+    return _ingested_rows(prefix)
+
+def _count_performance():
+    import transform as t
+    t.count_performance(incremental=False)
+    return _ingested_rows('Performance')
+
+def _transform():
+    import transform as t
+    t.perform_xform()
+    return _ingested_rows('Acquisition')
+
+def _fit_model():
+    import train as tr
+    train = tr.read()
+    tr.train_model(train=train, force=True)
+    return len(train)
+
+STAGES = [
+    ('uzip', _uzip, ())
+    ,('f_concat_acq', _f_concat, ('Acquisition',))
+    ,('f_concat_perf', _f_concat, ('Performance',))
+    ,('count_perf', _count_performance, ())
+    ,('transform', _transform, ())
+    ,('fit_model', _fit_model, ())
+]
+
+def revision():
+    '''
+    The git commit being benchmarked, if there is one.
+    '''
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD']
+                                      ,cwd=os.path.dirname(os.path.abspath(__file__))
+                                      ,stderr=subprocess.DEVNULL)
+        return out.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def record(results, params, out=None):
+    '''
+    Append a run's results, one JSON line per stage.
+    '''
+    out = out or os.path.join(st.BENCHMARK_DIR, 'results.jsonl')
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    common = {
+        'timestamp' : time.strftime('%Y-%m-%dT%H:%M:%S')
+        ,'revision' : revision()
+        ,'python' : platform.python_version()
+        ,'host' : platform.node()
+    }
+    common.update(params)
+    with open(out, 'a') as f:
+        for stage, result in results.items():
+            f.write(json.dumps(dict(common, stage=stage, **result)) + '\n')
+    return out
+
+def bench_pipeline(loans=10000, quarters=4, workdir=None, out=None, stages=None, **kwargs):
+    '''
+    Generate loans loans per quarter for quarters quarters into workdir (a
+    temporary directory by default), then time each stage over it. Extra
+    keyword arguments are passed to generate.generate. The results are
+    appended to out, BENCHMARK_DIR/results.jsonl by default, so runs can be
+    compared; every other path the pipeline writes to is moved into workdir
+    for the run, and restored after.
+    '''
+    workdir = workdir or tempfile.mkdtemp(prefix='fnma_bench_')
+    out = out or os.path.join(st.BENCHMARK_DIR, 'results.jsonl')
+    paths = {
+        'DATA_DIR' : os.path.join(workdir, 'landing')
+        ,'DIW_DIR' : os.path.join(workdir, 'diw')
+        ,'CATEGORY_MAPPING_DIR' : os.path.join(workdir, 'category_mappings')
+        ,'IMPUTATION_DIR' : os.path.join(workdir, 'imputation')
+        ,'FEATURE_SELECTION_DIR' : os.path.join(workdir, 'feature_selection')
+        ,'MODEL_DIR' : os.path.join(workdir, 'models')
+        ,'LOG_FILE' : os.path.join(workdir, 'pipeline.log')
+        # The step by step breakdown of each stage
+        ,'TRACE_FILE' : os.path.join(workdir, 'trace.jsonl')
+    }
+    saved = {k : getattr(st, k) for k in paths}
+    for k, v in paths.items():
+        setattr(st, k, v)
+    try:
+        instrument.configure()
+        os.makedirs(st.DIW_DIR, exist_ok=True)
+        generate.generate(st.DATA_DIR, loans, count=quarters, **kwargs)
+        results = {}
+        for label, fn, args in STAGES:
+            if stages is not None and label not in stages:
+                continue
+            results[label] = measure(fn, *args)
+            report(label, results[label])
+        params = dict(kwargs, loans=loans, quarters=quarters, diw_format=st.DIW_FORMAT
+                      ,xform_partitions=st.XFORM_PARTITIONS, ingest_workers=st.INGEST_WORKERS)
+        out = record(results, params, out)
+    finally:
+        for k, v in saved.items():
+            setattr(st, k, v)
+    log.debug('Results written to %s', out)
+    return results
+
+if __name__ == '__main__':
+    # python benchmark.py <path to Performance_YYYYQn.txt> [prefix]
+    # python benchmark.py --pipeline [loans per quarter] [quarters]
+    if len(sys.argv) > 1 and sys.argv[1] == '--pipeline':
+        bench_pipeline(*[int(a) for a in sys.argv[2:4]])
+    else:
+        bench_reader(*sys.argv[1:3])
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 13:40:51 2026
+
+@author: dgill
+@description: Persistent dictionary of the category codes. A value's code is
+              its position in the column's list, and new values are only ever
+              appended, so codes stay stable across runs, incremental loads,
+              and scoring. The store is a small JSON file in
+              CATEGORY_MAPPING_DIR, with a version bumped on every change.
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+import settings as st
+
+def path():
+    return os.path.join(st.CATEGORY_MAPPING_DIR, 'category_map.json')
+
+def load():
+    '''
+    Load the store, or an empty one if it hasn't been written yet.
+    '''
+    if not os.path.exists(path()):
+        return {'version' : 0, 'columns' : {}}
+    with open(path(), 'r') as f:
+        return json.load(f)
+
+def save(store):
+    os.makedirs(st.CATEGORY_MAPPING_DIR, exist_ok=True)
+    # Write to a temporary file first, so a failed write can't corrupt the store
+    tmp = path() + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(store, f)
+    os.replace(tmp, path())
+
+def values(series):
+    '''
+    Distinct, non null values of a series, as strings.
+    '''
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        uniques = series.cat.categories
+    else:
+        uniques = pd.unique(series.dropna())
+    return set(str(v) for v in uniques)
+
+def update(store, frame, cols):
+    '''
+    Append any values of cols not already in the store. Returns True if the
+    store changed.
+    '''
+    changed = False
+    for col in cols:
+        known = store['columns'].setdefault(col, [])
+        new = values(frame[col]) - set(known)
+        if len(new):
+            # Sorted, so the codes don't depend on the order partitions are read
+            known.extend(sorted(new))
+            changed = True
+    if changed:
+        store['version'] += 1
+    return changed
+
+def encode(store, series, col=None):
+    '''
+    Map a series to its codes, through a lookup array built from the distinct
+    values. Nulls, and values not in the store, are -1.
+    '''
+    col = col or series.name
+    known = {v : i for i, v in enumerate(store['columns'].get(col, []))}
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype('category')
+    lookup = np.array([known.get(str(v), -1) for v in series.cat.categories] + [-1]
+                      ,dtype=np.int16)
+    # Null codes are -1, which picks up the trailing -1 in the lookup
+    return lookup[series.cat.codes.values]
+
+def decode(store, codes, col):
+    '''
+    Map codes back to their values.
+    '''
+    lookup = np.array(store['columns'][col] + [None], dtype=object)
+    return lookup[np.asarray(codes)]
@@ -7,9 +7,18 @@ Created on Sun Apr 29 12:33:26 2018
 """
 
 import settings as st
+import setup
+import storage
 import os
+import hashlib
+import logging
 import pandas as pd
 import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from janitor import State
+import instrument
+
+log = logging.getLogger('extract')
 
 def uzip(remove_old=True):
     '''
@@ -22,48 +31,206 @@ def uzip(remove_old=True):
     for filename in os.listdir():
         # unzip the files with '.zip' at the end
         if filename.endswith(key):
-            if st._DEBUG: print('[+] Extracting contents of %s' % filename);
+            log.debug('Extracting contents of %s', filename)
             zf = zipfile.ZipFile(filename, mode='r')
             zf.extractall()
             zf.close()
         if remove_old:
             os.remove(filename)
-            if st._DEBUG: print('[+] Removing %s' % filename);
-            
-def f_concat(prefix='Acquisition'):
-    '''
-    Merge all of the files together
-    '''
-    files = os.listdir(st.DATA_DIR)
-    full_file = []
-    # Iterate over the list of files with the provided prefix, and read the
-    # contents into a data frame. Then, we will union all of the contents
-    # together. Finally, we write the contents to an output file
-    for f in files:
-        if f.startswith(prefix):
-            if st._DEBUG: print('[+] Reading %s' % f)
-            in_file = pd.read_csv(os.path.join(st.DATA_DIR, f)
-                                  ,sep='|', header=None
-                                  ,names=st.HEADERS[prefix]
-                                  ,index_col=False
-                                  ,error_bad_lines=False)
-            in_file = in_file[st.SELECT[prefix]]
-            full_file.append(in_file)
-        else:
+            log.debug('Removing %s', filename)
+
+def remove_zips():
+    '''
+    Remove the zip files in the data directory. Only called once the members
+    have been read successfully.
+    '''
+    for filename in os.listdir(st.DATA_DIR):
+        if filename.endswith('.zip'):
+            os.remove(os.path.join(st.DATA_DIR, filename))
+            log.debug('Removing %s', filename)
+
+def read_file(f, prefix='Acquisition', prune=True, chunksize=None):
+    '''
+    Parse a single pipe delimited file. `f` may be a path, or an open file
+    object (such as a zip member), so both ingestion modes share this path.
+    When prune is set, only the SELECT columns are parsed, with the types
+    declared in settings.DTYPES. With a chunksize, this yields frames of at
+    most chunksize rows instead.
+    '''
+    kwargs = {}
+    if prune:
+        kwargs['usecols'] = st.SELECT[prefix]
+        kwargs['dtype'] = {c : st.DTYPES[prefix][c] for c in st.SELECT[prefix]}
+    in_file = pd.read_csv(f, sep='|', header=None
+                          ,names=st.HEADERS[prefix]
+                          ,index_col=False
+                          ,on_bad_lines='skip'
+                          ,chunksize=chunksize
+                          ,**kwargs)
+    # usecols does not keep the select order
+    if chunksize:
+        return (chunk[st.SELECT[prefix]] for chunk in in_file)
+    return in_file[st.SELECT[prefix]]
+
+def quarter(name):
+    '''
+    The quarter a file covers, e.g. Performance_2007Q3.txt -> 2007Q3
+    '''
+    return os.path.splitext(os.path.basename(name))[0].split('_')[-1]
+
+def landing_files(prefix='Acquisition'):
+    '''
+    List (name, path, member) for the extracted files in the data directory.
+    '''
+    return [(f, os.path.join(st.DATA_DIR, f), None)
+            for f in sorted(os.listdir(st.DATA_DIR)) if f.startswith(prefix)]
+
+def zip_members(prefix='Acquisition'):
+    '''
+    List (name, path, member) for the members of each zip file in the data
+    directory, with the provided prefix. The members are streamed straight
+    out of the archive when read, so nothing is written to disk.
+    '''
+    members = []
+    for filename in sorted(os.listdir(st.DATA_DIR)):
+        if not filename.endswith('.zip'):
             continue
-    if len(full_file) == 0:
-        if st._DEBUG: print('[-] Error: No records to concat check to see if files exist')
+        path = os.path.join(st.DATA_DIR, filename)
+        with zipfile.ZipFile(path, mode='r') as zf:
+            for member in zf.namelist():
+                if os.path.basename(member).startswith(prefix):
+                    members.append((member, path, member))
+    return members
+
+def manifest():
+    '''
+    The ingestion manifest, recording each file ingested into the DIW layer.
+    '''
+    os.makedirs(st.DIW_DIR, exist_ok=True)
+    return State(os.path.join(st.DIW_DIR, 'manifest.yaml'))
+
+def checksum(path, blocksize=2**20):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+def fingerprint(path, entry=None):
+    '''
+    Size, modification time, and checksum of a source file. If the size and
+    modification time match the manifest entry, its checksum is reused rather
+    than re-reading the file.
+    '''
+    stat = os.stat(path)
+    fp = {'size' : stat.st_size, 'mtime' : stat.st_mtime}
+    if entry and entry['size'] == fp['size'] and entry['mtime'] == fp['mtime']:
+        fp['checksum'] = entry['checksum']
     else:
-        full_file = pd.concat(full_file, axis=0)
-        if st._DEBUG: print('[+] Writing %s' % os.path.join(st.DIW_DIR
-                                                       ,'{}.csv'.format(prefix)))
-        full_file.to_csv(os.path.join(st.DIW_DIR, '{}.csv'.format(prefix))
-                        ,index=False)
+        fp['checksum'] = checksum(path)
+    return fp
+
+def is_ingested(entry, fp, columns=None, partitions=None):
+    '''
+    Whether the file was ingested unchanged, with the same columns selected,
+    in the current DIW format, and sorted if JOIN_MODE needs it, and its
+    partition is still among partitions, the ones written.
+    '''
+    return entry is not None and entry['size'] == fp['size'] \
+        and entry['checksum'] == fp['checksum'] \
+        and (columns is None or entry.get('columns') == columns) \
+        and entry.get('format') == storage.get_format() \
+        and (st.JOIN_MODE != 'sorted' or entry.get('sorted', False)) \
+        and (partitions is None or entry['partition'].split('/')[-1] in partitions)
 
-def extract(remove_old=True):
-    uzip()
-    f_concat()
-    f_concat(prefix='Performance')
+def ingest_quarter(prefix, path, member):
+    '''
+    Parse a single quarterly file, and write it to its own partition. Runs in
+    a worker process. Returns the partition path, row count, and statistics,
+    which the parent records in the dataset's metadata.
+    '''
+    if member:
+        with zipfile.ZipFile(path, mode='r') as zf:
+            with zf.open(member) as f:
+                in_file = read_file(f, prefix)
+    else:
+        in_file = read_file(path, prefix)
+    if st.JOIN_MODE == 'sorted':
+        # Stable, so each loan's records keep their order
+        in_file = in_file.sort_values('id', kind='stable')
+    out = storage.write(in_file, prefix, partition=quarter(member or path), stats=False)
+    return out, len(in_file), storage.partition_stats(in_file)
+
+def f_concat(prefix='Acquisition', stream=False, workers=None, incremental=None):
+    '''
+    Parse each quarterly file in a process pool, and write every quarter to
+    its own partition of the <prefix> DIW dataset. The quarters are never
+    concatenated in memory. When stream is set, the files are read directly
+    from the zip archives instead of the extracted text files. When
+    incremental is set, files already in the manifest, and unchanged, are
+    skipped. Returns True if every file was read.
+    '''
+    if workers is None:
+        workers = st.INGEST_WORKERS
+    if incremental is None:
+        incremental = st.INCREMENTAL
+    sources = zip_members(prefix) if stream else landing_files(prefix)
+    if len(sources) == 0:
+        log.warning('No %s files to concat, check to see if files exist', prefix)
+        return False
+    state = manifest()
+    # Fingerprint each source file once - the zips hold several members
+    fingerprints = {}
+    partitions = set(storage.list_partitions(prefix))
+    with instrument.step('f_concat:{}'.format(prefix), logger=log) as record, \
+            ProcessPoolExecutor(max_workers=workers
+                                ,initializer=setup.apply_settings
+                                ,initargs=(setup.settings_snapshot(),)) as pool:
+        record.rows_out = 0
+        futures = {}
+        for name, path, member in sources:
+            if path not in fingerprints:
+                fingerprints[path] = fingerprint(path, state[name])
+            if incremental and is_ingested(state[name], fingerprints[path], st.SELECT[prefix]
+                                           ,partitions):
+                log.debug('Skipping %s, already ingested', name)
+                continue
+            log.debug('Reading %s', name)
+            futures[pool.submit(ingest_quarter, prefix, path, member)] = (name, path, member)
+        for future in as_completed(futures):
+            name, path, member = futures[future]
+            out, rows, stats = future.result()
+            storage.update_metadata(prefix, quarter(member or path), stats)
+            log.debug('Wrote %d rows from %s to %s', rows, name, out)
+            record.rows_out += rows
+            # Record the file as soon as it's written, so an interrupted run
+            # keeps its progress
+            state[name] = dict(fingerprints[path]
+                               ,source=os.path.basename(path)
+                               ,partition='{}/{}'.format(prefix, quarter(member or path))
+                               ,columns=list(st.SELECT[prefix])
+                               ,format=storage.get_format()
+                               ,sorted=st.JOIN_MODE == 'sorted'
+                               ,rows=rows)
+            state.save()
+    storage.finalize(prefix)
+    return True
+
+@instrument.timed('extract', logger=log)
+def extract(remove_old=True, stream=None):
+    if stream is None:
+        stream = st.STREAM_ZIP
+    if stream:
+        # Both file types live in the same archives, so the zips can only go
+        # once every member has been read
+        read = f_concat(stream=True)
+        read = f_concat(prefix='Performance', stream=True) and read
+        if read and remove_old:
+            remove_zips()
+    else:
+        uzip(remove_old)
+        f_concat()
+        f_concat(prefix='Performance')
 
 if __name__ == '__main__':
-    extract(True)
\ No newline at end of file
+    extract(True)
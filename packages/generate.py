@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 17:55:02 2026
+
+@author: dgill
+@description: Synthetic Fannie Mae data. Writes pipe delimited
+              Acquisition_YYYYQn.txt and Performance_YYYYQn.txt files, laid
+              out like settings.HEADERS, and zipped like the real downloads,
+              so the pipeline can be run and benchmarked without the real data.
+"""
+
+import os
+import argparse
+import logging
+import zipfile
+import numpy as np
+import pandas as pd
+import settings as st
+
+log = logging.getLogger('generate')
+
+SELLERS = ['BANK OF AMERICA, N.A.', 'WELLS FARGO BANK, N.A.', 'JPMORGAN CHASE BANK, N.A.'
+           ,'CITIMORTGAGE, INC.', 'SUNTRUST MORTGAGE INC.', 'OTHER']
+STATES = ['CA', 'FL', 'TX', 'NY', 'IL', 'GA', 'AZ', 'NV', 'OH', 'MI', 'WA', 'NJ']
+# Columns which get nulls at the requested rate
+NULLABLE = {
+    'Acquisition' : ['cltv', 'borrower_count', 'dti', 'borrower_credit_score']
+    ,'Performance' : ['servicer_name', 'msa']
+}
+
+def quarters(start='2005Q1', count=4):
+    return [str(p) for p in pd.period_range(start, periods=count, freq='Q')]
+
+def add_nulls(frame, cols, rate, rng):
+    for col in cols:
+        frame.loc[rng.random(len(frame)) < rate, col] = None
+    return frame
+
+def acquisition(quarter, ids, rng, null_rate=0.01):
+    n = len(ids)
+    start = pd.Period(quarter, freq='Q').asfreq('M', 'start')
+    origination = np.array([str(start + i) for i in range(3)])[rng.integers(0, 3, n)]
+    origination = pd.PeriodIndex(origination, freq='M')
+    ltv = rng.integers(30, 98, n)
+    frame = pd.DataFrame({
+        'id' : ids
+        ,'channel' : rng.choice(['R', 'B', 'C'], n, p=[.6, .25, .15])
+        ,'seller' : rng.choice(SELLERS, n)
+        ,'interest_rate' : np.round(rng.normal(5.75, .6, n), 3)
+        ,'balance' : (rng.integers(50, 600, n) * 1000)
+        ,'loan_term' : rng.choice([360, 180, 240], n, p=[.85, .12, .03])
+        ,'origination_date' : origination.strftime('%m/%Y')
+        ,'first_payment_date' : (origination + 2).strftime('%m/%Y')
+        ,'ltv' : ltv
+        ,'cltv' : ltv + rng.integers(0, 2, n) * rng.integers(0, 15, n)
+        ,'borrower_count' : rng.choice([1, 2], n)
+        ,'dti' : rng.integers(10, 64, n)
+        ,'borrower_credit_score' : np.clip(rng.normal(730, 50, n), 300, 850).astype(int)
+        ,'first_time_homebuyer' : rng.choice(['N', 'Y', 'U'], n, p=[.85, .13, .02])
+        ,'loan_purpose' : rng.choice(['P', 'C', 'R'], n)
+        ,'property_type' : rng.choice(['SF', 'PU', 'CO', 'MH', 'CP'], n, p=[.7, .15, .1, .03, .02])
+        ,'unit_count' : rng.choice([1, 2, 3, 4], n, p=[.95, .03, .01, .01])
+        ,'occupancy_status' : rng.choice(['P', 'S', 'I'], n, p=[.88, .04, .08])
+        ,'property_state' : rng.choice(STATES, n)
+        ,'zip' : rng.integers(100, 999, n)
+        ,'insurance_percentage' : None
+        ,'product_type' : 'FRM'
+        ,'co_borrower_credit_score' : None
+        ,'mortgage_insurance_type' : None
+        ,'relocation_mortgage_indicator' : 'N'
+    })
+    return add_nulls(frame, NULLABLE['Acquisition'], null_rate, rng)[st.HEADERS['Acquisition']]
+
+def performance(acq, rng, foreclosure_rate=0.02, max_months=48, null_rate=0.01):
+    '''
+    Monthly history for each loan. Foreclosed loans go delinquent over their
+    last few months, and carry a foreclosure date on their final record.
+    '''
+    n = len(acq)
+    months = rng.integers(1, max_months + 1, n)
+    foreclosed = rng.random(n) < foreclosure_rate
+    rows = np.repeat(np.arange(n), months)
+    # Month number within each loan's history
+    age = np.arange(len(rows)) - np.repeat(np.cumsum(months) - months, months)
+    last = age == months[rows] - 1
+    first_payment = pd.PeriodIndex(acq['first_payment_date'].values, freq='M')
+    period = first_payment[rows] + age
+    remaining = months[rows] - age - 1
+    delinquency = np.where(foreclosed[rows], np.clip(6 - remaining, 0, None), 0)
+    rate = acq['interest_rate'].values[rows]
+    balance = acq['balance'].values[rows] * (1 - age / acq['loan_term'].values[rows])
+    fc_date = np.where(foreclosed[rows] & last, (period + 1).strftime('%m/01/%Y'), None)
+    zero_balance = np.where(last & ~foreclosed[rows] & (rng.random(len(rows)) < .5), '01', None)
+    frame = pd.DataFrame({c : None for c in st.HEADERS['Performance']}, index=np.arange(len(rows)))
+    frame['id'] = acq['id'].values[rows]
+    frame['reporting_period'] = period.strftime('%m/01/%Y')
+    frame['servicer_name'] = acq['seller'].values[rows]
+    frame['interest_rate'] = rate
+    frame['balance'] = np.round(balance, 2)
+    frame['loan_age'] = age
+    frame['months_to_maturity'] = acq['loan_term'].values[rows] - age
+    frame['adj_months_to_maturity'] = frame['months_to_maturity']
+    frame['msa'] = rng.integers(10000, 49999, n)[rows]
+    frame['delinquency_status'] = delinquency.astype(str)
+    frame['modification_flag'] = np.where(foreclosed[rows] & (remaining < 3), 'Y', 'N')
+    frame['zero_balance_code'] = np.where(foreclosed[rows] & last, '09', zero_balance)
+    frame['foreclosure_date'] = fc_date
+    return add_nulls(frame, NULLABLE['Performance'], null_rate, rng)
+
+def generate(out_dir, loans=10000, start='2005Q1', count=4, foreclosure_rate=0.02
+             ,null_rate=0.01, max_months=48, zipped=True, seed=0):
+    '''
+    Write count quarters of synthetic data, with loans loans per quarter, to
+    out_dir. When zipped, each quarter is written as <quarter>.zip holding both
+    files, like the real downloads. Returns the paths written.
+    '''
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+    for i, q in enumerate(quarters(start, count)):
+        ids = 100000000000 + i * loans + np.arange(loans)
+        acq = acquisition(q, ids, rng, null_rate)
+        perf = performance(acq, rng, foreclosure_rate, max_months, null_rate)
+        files = {}
+        for prefix, frame in [('Acquisition', acq), ('Performance', perf)]:
+            files['{}_{}.txt'.format(prefix, q)] = frame.to_csv(sep='|', header=False, index=False)
+        if zipped:
+            pth = os.path.join(out_dir, '{}.zip'.format(q))
+            with zipfile.ZipFile(pth, mode='w', compression=zipfile.ZIP_DEFLATED) as zf:
+                for name, data in files.items():
+                    zf.writestr(name, data)
+            written.append(pth)
+        else:
+            for name, data in files.items():
+                pth = os.path.join(out_dir, name)
+                with open(pth, 'w') as f:
+                    f.write(data)
+                written.append(pth)
+        log.debug('Generated %s: %d loans, %d performance records', q, len(acq), len(perf))
+    return written
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write synthetic Fannie Mae loan data.')
+    parser.add_argument('out_dir')
+    parser.add_argument('--loans', type=int, default=10000, help='loans per quarter')
+    parser.add_argument('--start', default='2005Q1', help='first quarter')
+    parser.add_argument('--quarters', type=int, default=4, help='number of quarters')
+    parser.add_argument('--foreclosure-rate', type=float, default=0.02)
+    parser.add_argument('--null-rate', type=float, default=0.01)
+    parser.add_argument('--max-months', type=int, default=48, help='longest loan history')
+    parser.add_argument('--unzipped', action='store_true', help='write the text files, rather than zips')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if st._DEBUG else logging.INFO, format='[+] %(message)s')
+    generate(args.out_dir, args.loans, args.start, args.quarters, args.foreclosure_rate
+             ,args.null_rate, args.max_months, not args.unzipped, args.seed)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 15:21:09 2026
+
+@author: dgill
+@description: Statistics used to fill nulls in the acquisition data. All of
+              them (means, medians, and means grouped by IMPUTE_GROUPS) are
+              gathered in a single streaming pass, then persisted, so new
+              partitions and scoring data are filled without recomputing.
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+import settings as st
+
+class FillStatistics(object):
+    '''
+    Accumulates the fill statistics over chunks of acquisition data. The
+    median is estimated with a fixed bin histogram over each column's bounds
+    in IMPUTE_COLS, which is exact for the whole number columns we fill.
+    '''
+    def __init__(self, cols=None, groups=None):
+        self.cols = cols or st.IMPUTE_COLS
+        self.groups = groups or st.IMPUTE_GROUPS
+        self.sums = pd.Series(0.0, index=list(self.cols))
+        self.counts = pd.Series(0, index=list(self.cols))
+        self.histograms = {c : np.zeros(hi - lo + 1, dtype=np.int64)
+                           for c, (lo, hi) in self.cols.items()}
+        self.group_sums = None
+        self.group_counts = None
+
+    def update(self, chunk):
+        values = chunk[list(self.cols)].astype(np.float64)
+        self.sums += values.sum()
+        self.counts += values.count()
+        for col, (lo, hi) in self.cols.items():
+            v = values[col].dropna().values
+            bins = np.clip(np.rint(v), lo, hi).astype(np.int64) - lo
+            self.histograms[col] += np.bincount(bins, minlength=hi - lo + 1)
+        # One group by for every column
+        keys = [chunk[g].astype(object) for g in self.groups]
+        grouped = values.groupby(keys)
+        sums, counts = grouped.sum(), grouped.count()
+        if self.group_sums is None:
+            self.group_sums, self.group_counts = sums, counts
+        else:
+            self.group_sums = self.group_sums.add(sums, fill_value=0)
+            self.group_counts = self.group_counts.add(counts, fill_value=0)
+        return self
+
+    def median(self, col):
+        lo, _ = self.cols[col]
+        hist = self.histograms[col]
+        if hist.sum() == 0:
+            return None
+        return float(lo + np.searchsorted(np.cumsum(hist), hist.sum() / 2.0))
+
+    def finish(self):
+        '''
+        The statistics, as a JSON serializable dict.
+        '''
+        stats = {
+            'groups' : list(self.groups)
+            ,'mean' : {}
+            ,'median' : {}
+            ,'group_mean' : {}
+        }
+        for col in self.cols:
+            n = int(self.counts[col])
+            stats['mean'][col] = float(self.sums[col] / n) if n else None
+            stats['median'][col] = self.median(col)
+            stats['group_mean'][col] = []
+            if self.group_sums is not None:
+                means = (self.group_sums[col] / self.group_counts[col]).dropna()
+                stats['group_mean'][col] = [list(k) + [float(v)] for k, v in means.items()]
+        return stats
+
+def compute(chunks, cols=None, groups=None):
+    '''
+    Fill statistics over an iterable of frames.
+    '''
+    acc = FillStatistics(cols, groups)
+    for chunk in chunks:
+        acc.update(chunk)
+    return acc.finish()
+
+def path():
+    return os.path.join(st.IMPUTATION_DIR, 'imputation.json')
+
+def save(stats):
+    os.makedirs(st.IMPUTATION_DIR, exist_ok=True)
+    with open(path(), 'w') as f:
+        json.dump(stats, f)
+
+def load():
+    with open(path(), 'r') as f:
+        return json.load(f)
+
+def group_means(stats, col):
+    '''
+    The grouped means of a column, as a series indexed by the group values.
+    '''
+    rows = stats['group_mean'][col]
+    index = pd.MultiIndex.from_tuples([tuple(r[:-1]) for r in rows], names=stats['groups'])
+    return pd.Series([r[-1] for r in rows], index=index, dtype=np.float64)
+
+def apply(frame, stats, strategy=None):
+    '''
+    Fill the nulls in a frame. strategy is one of mean, median, or group_mean;
+    rows whose group has no mean fall back to the overall mean.
+    '''
+    strategy = strategy or st.IMPUTE_STRATEGY
+    overall = stats['median'] if strategy == 'median' else stats['mean']
+    for col in stats['mean']:
+        nulls = frame[col].isna()
+        if overall[col] is None or not nulls.any():
+            continue
+        fill = pd.Series(overall[col], index=frame.index, dtype=np.float64)
+        if strategy == 'group_mean' and len(stats['group_mean'][col]):
+            keys = pd.MultiIndex.from_frame(frame[stats['groups']].astype(object))
+            grouped = group_means(stats, col).reindex(keys).values
+            fill = pd.Series(grouped, index=frame.index).fillna(overall[col])
+        # The nullable integer columns only take whole numbers
+        if pd.api.types.is_integer_dtype(frame[col].dtype):
+            fill = fill.round()
+        frame[col] = frame[col].fillna(fill.astype(frame[col].dtype))
+    return frame
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 19:20:37 2026
+
+@author: dgill
+@description: Timing and memory instrumentation for the pipeline. step() is a
+              context manager, and timed() a decorator, recording the wall
+              time, CPU time, rows in and out, and RSS change of a named step.
+              Steps nest, so a record's name is the path of the steps it's
+              running under, e.g. transform.clean_nulls. Records go to the
+              logs set up through janitor.LogFile, and, when TRACE_FILE is
+              set, to a JSON lines trace.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from janitor import LogFile
+import settings as st
+
+try:
+    import resource
+    HAVE_RESOURCE = True
+except ImportError:
+    HAVE_RESOURCE = False
+
+try:
+    import psutil
+    HAVE_PSUTIL = True
+except ImportError:
+    HAVE_PSUTIL = False
+
+LOGGERS = ['pipeline', 'extract', 'transform', 'model', 'train', 'score', 'instrument'
+           ,'generate', 'benchmark']
+LOG_FORMAT = '%(asctime)s:%(name)s:%(levelname)s:%(module)s:%(lineno)d:%(message)s'
+
+log = logging.getLogger('instrument')
+_configured = False
+_lock = threading.Lock()
+_local = threading.local()
+
+def configure(path=None):
+    '''
+    Attach the log file, LOG_FILE by default, to the pipeline's loggers. The
+    progress messages are logged at debug, so they're only kept when _DEBUG
+    is set, in which case they're also echoed to the console. Only the first
+    call has any effect.
+    '''
+    global _configured
+    with _lock:
+        if _configured:
+            return
+        path = path or st.LOG_FILE
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        LogFile(path, loggers=LOGGERS, formatter={'fmt' : LOG_FORMAT}).prepare()
+        level = logging.DEBUG if st._DEBUG else logging.INFO
+        console = logging.StreamHandler(sys.stdout)
+        console.setFormatter(logging.Formatter('[+] %(message)s'))
+        console.setLevel(logging.DEBUG if st._DEBUG else logging.WARNING)
+        for name in LOGGERS:
+            logger = logging.getLogger(name)
+            logger.setLevel(level)
+            logger.addHandler(console)
+        _configured = True
+
+def peak_rss():
+    '''
+    Peak resident set size of the current process, in MB. None if neither
+    resource nor psutil is available.
+    '''
+    if HAVE_RESOURCE:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is reported in bytes on macOS, and kilobytes elsewhere
+        if sys.platform == 'darwin':
+            return peak / 2**20
+        return peak / 2**10
+    if HAVE_PSUTIL:
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / 2**20
+    return None
+
+def rss():
+    '''
+    Current resident set size, in MB. Without psutil, this falls back to the
+    peak, so deltas show growth of the high water mark instead.
+    '''
+    if HAVE_PSUTIL:
+        return psutil.Process().memory_info().rss / 2**20
+    return peak_rss()
+
+class Record(object):
+    '''
+    Measurements of a single step. Callers set rows_in and rows_out.
+    '''
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.wall = None
+        self.cpu = None
+        self.rss_delta = None
+        self.peak_rss = None
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    def __str__(self):
+        rows = ''
+        if self.rows_in is not None or self.rows_out is not None:
+            rows = ', rows {} -> {}'.format(*['?' if r is None else '{:,}'.format(r)
+                                              for r in (self.rows_in, self.rows_out)])
+        mem = '' if self.rss_delta is None else ', RSS {:+,.1f} MB'.format(self.rss_delta)
+        return '{}: {:.2f}s wall, {:.2f}s CPU{}{}'.format(self.name, self.wall, self.cpu, rows, mem)
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+def emit(record, logger=None):
+    (logger or log).info(str(record))
+    if st.TRACE_FILE:
+        with _lock:
+            with open(st.TRACE_FILE, 'a') as f:
+                f.write(json.dumps(dict(record.to_dict(), timestamp=time.time()
+                                        ,pid=os.getpid())) + '\n')
+
+@contextmanager
+def step(name, rows_in=None, logger=None):
+    '''
+    Measure the enclosed block as the step name. Yields the Record, so the
+    block can set its row counts:
+
+        with instrument.step('read', logger=log) as rec:
+            frame = read()
+            rec.rows_out = len(frame)
+    '''
+    configure()
+    stack = _stack()
+    record = Record('.'.join(stack + [name]), rows_in)
+    stack.append(name)
+    rss_start = rss()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    finally:
+        record.wall = time.perf_counter() - wall
+        record.cpu = time.process_time() - cpu
+        if rss_start is not None:
+            record.rss_delta = rss() - rss_start
+        record.peak_rss = peak_rss()
+        stack.pop()
+        emit(record, logger)
+
+def timed(name=None, logger=None):
+    '''
+    Decorator measuring each call as a step. The rows out are the row count
+    of the return value, when it's a frame or an array.
+    '''
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with step(name or fn.__name__, logger=logger) as record:
+                result = fn(*args, **kwargs)
+                # Only frames and arrays - the length of a dict is its keys
+                if getattr(result, 'shape', None):
+                    record.rows_out = result.shape[0]
+                return result
+        return wrapper
+    return decorator
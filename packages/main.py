@@ -5,33 +5,11 @@ Created on Sun Apr 29 10:45:05 2018
 @author: dgill
 """
 
-#import setup as s
-#import extract as e
-#import transform as t
-#import model as m
+import pipeline
 
-# Begin by allocating the variables in the settings file
-#s.setup()
-#e.extract(True)
-#t.perform_xform()
-#m.build_model()
+# The stages (setup, extract, transform, model, and train) are declared in
+# pipeline.py. Stages whose inputs and settings haven't changed since their
+# last run are skipped, so a rerun only repeats the work that's out of date.
 
 if __name__ == '__main__':
-    from janitor import ConfigFile
-
-    c = ConfigFile(path='D:\\School\\Machine Learning\\fnma_loan_performance\\config\\app.conf'
-                   ,load=True)
-
-    d = ConfigFile(path='D:\\School\\Machine Learning\\fnma_loan_performance\\config\\test_app.conf')
-
-    d.my_test_conf.testing = 'this is a test'
-    d.my_test_conf.testing_again = 'this is also a test'
-    d.my_test_list = [1, 2, 3, 4]
-
-    d.write_back()
-
-    e = ConfigFile(path='D:\\School\\Machine Learning\\fnma_loan_performance\\config\\test_app.conf', load=True)
-
-    print(e)
-
-    print(c)
+    pipeline.run()
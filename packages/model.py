@@ -6,60 +6,132 @@ Created on Sun Apr 29 16:13:24 2018
 """
 
 import os
-import numpy as np
+import json
+import hashlib
+import logging
 import pandas as pd
 import settings as st
+import storage
+import transform as t
 import setup
-import importlib
+import instrument
+import resample
 
-from sklearn import cross_validation
+from joblib import parallel_backend
+from sklearn.model_selection import cross_val_predict, train_test_split
 from sklearn.linear_model import LogisticRegression
 from sklearn import metrics
 from sklearn.feature_selection import RFE
 
-def select_features(train):
-    lr = LogisticRegression()
-    rfe = RFE(lr, 5)
+log = logging.getLogger('model')
+
+def backend():
+    '''
+    Context for fitting models on the configured joblib backend. Estimators,
+    and the cross validation folds, parallelized with n_jobs=None pick it up.
+    '''
+    return parallel_backend(st.EXECUTION_BACKEND, n_jobs=st.WORKERS)
+
+def data_fingerprint(train):
+    '''
+    Hash of the training data's schema, and of every row's values. Keys both
+    the feature selection cache and the model artifacts.
+    '''
+    sha = hashlib.sha1()
+    sha.update(json.dumps([[c, str(d)] for c, d in train.dtypes.items()]).encode())
+    sha.update(pd.util.hash_pandas_object(train, index=False).values.tobytes())
+    return sha.hexdigest()
+
+def feature_selection_path(key):
+    return os.path.join(st.FEATURE_SELECTION_DIR, 'features_{}.json'.format(key))
+
+def stratified_sample(train, size):
+    '''
+    At most size rows of the training data, keeping the class balance.
+    '''
+    if not size or len(train) <= size:
+        return train
+    sample, _ = train_test_split(train, train_size=size, stratify=train[st.TARGET]
+                                 ,random_state=0)
+    return sample
+
+def select_features(train, count=None, sample_size=None, force=False):
+    '''
+    Recursive feature elimination down to count predictors, run over a
+    stratified sample of sample_size rows. The result is kept in
+    FEATURE_SELECTION_DIR, keyed by the data's fingerprint and the
+    parameters, and RFE only reruns when the key changes.
+    '''
+    count = count or st.FEATURE_SELECTION_COUNT
+    sample_size = st.FEATURE_SELECTION_SAMPLE if sample_size is None else sample_size
     potential_predictors = train.columns.tolist()
     potential_predictors = [p for p in potential_predictors if p not in st.NON_PRED]
-    rfe = rfe.fit(train[potential_predictors], train[st.TARGET])
+    sha = hashlib.sha1(data_fingerprint(train).encode())
+    sha.update(json.dumps([st.TARGET, potential_predictors, count, sample_size]).encode())
+    key = sha.hexdigest()[:16]
+    pth = feature_selection_path(key)
+    if not force and os.path.exists(pth):
+        with open(pth, 'r') as f:
+            predictors = json.load(f)['features']
+        log.debug('Loaded selected features %s: %s', key, predictors)
+        return predictors
+    sample = stratified_sample(train, sample_size)
+    lr = LogisticRegression()
+    rfe = RFE(lr, n_features_to_select=count)
+    with instrument.step('rfe', len(sample), log), backend():
+        rfe = rfe.fit(t.predictor_matrix(sample, potential_predictors), sample[st.TARGET])
     predictor_sup = rfe.support_
     predictors = []
     for feature, feature_chosen in zip(potential_predictors, predictor_sup):
         if feature_chosen:
             predictors.append(feature)
+    os.makedirs(st.FEATURE_SELECTION_DIR, exist_ok=True)
+    with open(pth, 'w') as f:
+        json.dump({'key' : key, 'features' : predictors, 'rows' : len(train)
+                   ,'sample_rows' : len(sample)}, f)
     return predictors
 
-def prediction_model(train):
-    model = LogisticRegression(random_state=1, class_weight='balanced')
-    if st._DEBUG: print('[+] Building predictor list');
-    predictors = train.columns.tolist()
-    predictors = [p for p in predictors if p not in st.NON_PRED]
-    if st._DEBUG: print('[+] Training the model - this may take some time...');
-    predictions = cross_validation.cross_val_predict(model, train[predictors]
-                                                    ,train[st.TARGET],cv=st.FOLDS)
+def prediction_model(train, strategy='class_weight', predictors=None):
+    # Resampling is part of the model, so cross_val_predict only resamples the
+    # training folds
+    model = resample.pipeline(LogisticRegression(random_state=1), strategy)
+    log.debug('Building predictor list')
+    if predictors is None:
+        predictors = train.columns.tolist()
+        predictors = [p for p in predictors if p not in st.NON_PRED]
+    log.debug('Training the model - this may take some time...')
+    # The folds are fit in parallel, on the configured backend
+    with instrument.step('cross_val_predict', len(train), log), backend():
+        predictions = cross_val_predict(model, t.predictor_matrix(train, predictors)
+                                        ,train[st.TARGET], cv=st.FOLDS)
     return predictions
 
 def compute_error(target, predictions):
-    if st._DEBUG: print('[+] Computing error.');
+    log.debug('Computing error.')
     return metrics.accuracy_score(target, predictions)
 
 def compute_false_negatives(target, predictions):
-    if st._DEBUG: print('[+] Computing false negatives.');
+    log.debug('Computing false negatives.')
     false_negatives = pd.DataFrame({'target' : target, 'prediction' : predictions})
     neg_rate = false_negatives[(false_negatives['target'] == 1) & (false_negatives['prediction'] == 0)].shape(0) / \
         (false_negatives[(false_negatives['target']==1)].shape[0]+1)
     return neg_rate
 
 def compute_false_positives(target, predictions):
-    if st._DEBUG: print('[+] Computing false positives.');
+    log.debug('Computing false positives.')
     false_positives = pd.DataFrame({'target' : target, 'prediction' : predictions})
     pos_rate=false_positives[(false_positives['target'] == 0) & (false_positives['prediction'] == 1)].shape[0] / \
         (false_positives[(false_positives['target']==0)].shape[0] + 1)
     return pos_rate
 
-def read():
-    train = pd.read_csv(os.path.join(st.DIW_DIR, 'train.csv'))
+def read(filters=None, vintages=None):
+    '''
+    The training data, limited to the vintages, e.g. (2004, 2008), and rows
+    matching filters, e.g. [('property_state', '==', 'CA')]. Only the
+    matching partitions are read.
+    '''
+    train = storage.read('train', filters=t.vintage_filters(vintages, filters))
+    t.report_memory(train, 'Training data')
     return train
 
 def write():
@@ -68,17 +140,22 @@ def write():
     '''
     pass
 
-def build_model(features=None):
-    if features == None:
-        importlib.reload(settings)
-    else:
+@instrument.timed('model', logger=log)
+def build_model(features=None, vintages=None):
+    # With no features passed, the predictors are everything not in NON_PRED,
+    # or, with DYNAMIC_FEATURE_SELECTION, those chosen by select_features.
+    # Reloading the settings here would drop the paths set up at run time.
+    if features is not None:
         setup.set_features(features)
-    train = read()
-    predictions = prediction_model(train)
+    train = read(vintages=vintages)
+    predictors = None
+    if features is None and st.DYNAMIC_FEATURE_SELECTION:
+        predictors = select_features(train)
+    predictions = prediction_model(train, predictors=predictors)
     model_error = compute_error(train[st.TARGET], predictions)
     #FN = compute_false_negatives(train[st.TARGET], predictions)
     #FP = compute_false_positive(train[st.TARGET], predictions)
-    print("Accuracy of the model:{}".format(model_error))
+    log.info('Accuracy of the model: %s', model_error)
     #print("False Negatives:{}".format(FN))
     #print("False Positive:{}".format(FP))
 
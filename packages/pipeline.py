@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 16:48:30 2026
+
+@author: dgill
+@description: A small runner for the pipeline stages. Each stage declares the
+              stages it depends on, its input and output paths, and the
+              settings it reads. Before a stage runs, those are hashed into a
+              stamp; if the stamp matches the last successful run, and the
+              outputs exist, the stage is skipped. Stages whose dependencies
+              are done run concurrently.
+"""
+
+import os
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from janitor import State
+import settings as st
+import storage
+
+log = logging.getLogger('pipeline')
+
+def fingerprint(paths):
+    '''
+    Hash of the files under paths. Files are identified by their relative
+    path, size, and modification time, so large inputs aren't re-read on
+    every run; the ingestion manifest checksums the raw files themselves.
+    '''
+    sha = hashlib.sha1()
+    for root in sorted(paths):
+        if os.path.isfile(root):
+            files = [root]
+        else:
+            files = sorted(os.path.join(d, f) for d, _, fs in os.walk(root) for f in fs)
+        for f in files:
+            stat = os.stat(f)
+            sha.update('{}|{}|{}\n'.format(os.path.relpath(f, root), stat.st_size
+                                           ,stat.st_mtime_ns).encode())
+    return sha.hexdigest()
+
+def dataset(name):
+    '''
+    Paths of a DIW dataset, both its single file and its partitions.
+    '''
+    return lambda: [p for p in [storage.path(name), os.path.join(st.DIW_DIR, name)]
+                    if os.path.exists(p)]
+
+class Stage(object):
+    def __init__(self, name, run, deps=(), inputs=(), outputs=(), settings=(), cache=True):
+        '''
+        @Params:    * name - Name of the stage.
+                    * run - Function which runs the stage.
+                    * deps - Names of the stages which must complete first.
+                    * inputs - Functions returning the paths the stage reads.
+                    * outputs - Functions returning the paths the stage writes.
+                    * settings - Names of the settings the stage reads.
+                    * cache - Whether the stage may be skipped. Stages without
+                      outputs, like setup, should always run.
+        '''
+        self.name = name
+        self.run = run
+        self.deps = list(deps)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.settings = list(settings)
+        self.cache = cache
+
+    def stamp(self):
+        sha = hashlib.sha1()
+        sha.update(fingerprint([p for f in self.inputs for p in f()]).encode())
+        for key in sorted(self.settings):
+            sha.update('{}={!r}\n'.format(key, getattr(st, key)).encode())
+        return sha.hexdigest()
+
+    def outputs_exist(self):
+        return all(len(f()) > 0 for f in self.outputs)
+
+def stages():
+    # Imported here, so importing the runner doesn't pull in every stage
+    import setup as s
+    import extract as e
+    import transform as t
+    import model as m
+    import train as tr
+    return [
+        Stage('setup', s.setup, cache=False)
+        ,Stage('extract', lambda: e.extract(True), deps=['setup']
+               ,inputs=[lambda: [st.DATA_DIR]]
+               ,outputs=[dataset('Acquisition'), dataset('Performance')]
+               ,settings=['HEADERS', 'SELECT', 'DTYPES', 'DIW_FORMAT', 'STREAM_ZIP', 'JOIN_MODE'])
+        ,Stage('transform', t.perform_xform, deps=['extract']
+               ,inputs=[dataset('Acquisition'), dataset('Performance')]
+               ,outputs=[dataset('train')]
+               ,settings=['COMPACT_DTYPES', 'CATEGORY_COLS', 'IMPUTE_COLS', 'IMPUTE_STRATEGY'
+                          ,'IMPUTE_GROUPS', 'DATE_ENCODING', 'DROP_COLS'
+                          ,'MINIMUM_QUARTER_COUNT', 'XFORM_PARTITIONS', 'DIW_FORMAT'
+                          ,'JOIN_MODE', 'VINTAGE', 'SAMPLE_FRACTION', 'SAMPLE_ROWS'
+                          ,'OBSERVATION_MONTHS'])
+        ,Stage('model', m.build_model, deps=['transform']
+               ,inputs=[dataset('train')]
+               ,settings=['NON_PRED', 'TARGET', 'FOLDS', 'DYNAMIC_FEATURE_SELECTION'
+                          ,'FEATURE_SELECTION_COUNT', 'FEATURE_SELECTION_SAMPLE'])
+        ,Stage('train', tr.train_model, deps=['transform']
+               ,inputs=[dataset('train')]
+               ,outputs=[lambda: [st.MODEL_DIR] if os.path.exists(st.MODEL_DIR) else []]
+               ,settings=['NON_PRED', 'TARGET', 'MODEL_PARAMS'])
+    ]
+
+def state():
+    return State(os.path.join(st.DIW_DIR, 'pipeline.yaml'))
+
+def required(graph, targets):
+    '''
+    Names of the targets, and every stage they depend on.
+    '''
+    needed = set()
+    pending = list(targets)
+    while len(pending):
+        name = pending.pop()
+        if name not in needed:
+            needed.add(name)
+            pending.extend(graph[name].deps)
+    return needed
+
+def run(targets=None, force=False, graph=None):
+    '''
+    Run the pipeline, or the stages needed for targets. Up to date stages are
+    skipped unless force is set.
+    '''
+    graph = {stage.name : stage for stage in (graph or stages())}
+    needed = required(graph, targets or list(graph))
+    done = set()
+    stamps = None
+    running = {}
+    with ThreadPoolExecutor(max_workers=len(needed)) as pool:
+        while len(done) < len(needed):
+            for name in sorted(needed - done - set(running.values())):
+                stage = graph[name]
+                if not all(d in done for d in stage.deps):
+                    continue
+                if stage.cache:
+                    # The state lives in the DIW directory, which setup configures
+                    stamps = stamps or state()
+                    stamp = stage.stamp()
+                    if not force and stamps[name] == stamp and stage.outputs_exist():
+                        log.debug('Skipping %s, up to date.', name)
+                        done.add(name)
+                        continue
+                log.debug('Running %s.', name)
+                running[pool.submit(stage.run)] = name
+            if len(running) == 0:
+                # Skips may have readied more stages
+                continue
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                future.result()
+                if graph[name].cache:
+                    stamps = stamps or state()
+                    stamps[name] = graph[name].stamp()
+                    stamps.save()
+                done.add(name)
+    return done
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 20:41:16 2026
+
+@author: dgill
+@description: Resampling strategies for the class imbalance. Resampler is an
+              imblearn sampler, so it goes at the head of an imblearn
+              Pipeline, which only resamples the data the pipeline is fit on -
+              the training split, or each training fold inside
+              cross_val_predict - and never the data it predicts.
+"""
+
+import time
+import logging
+import numpy as np
+from sklearn.base import BaseEstimator
+from imblearn.pipeline import Pipeline
+from imblearn.under_sampling import RandomUnderSampler
+from imblearn.over_sampling import SMOTE
+from imblearn.combine import SMOTEENN
+
+log = logging.getLogger('train')
+
+def majority_quota(majority_ratio):
+    '''
+    An undersampling strategy keeping majority_ratio majority rows for every
+    minority row, or every majority row when there are fewer than that.
+    '''
+    def strategy(y):
+        counts = balance(y)
+        minority = min(counts, key=counts.get)
+        majority = max(counts, key=counts.get)
+        return {majority : min(counts[majority], int(majority_ratio * counts[minority]))}
+    return strategy
+
+def _undersample(majority_ratio, k_neighbors, random_state):
+    # Majority rows are drawn at random, and every minority row is kept
+    return RandomUnderSampler(sampling_strategy=majority_quota(majority_ratio)
+                              ,random_state=random_state)
+
+def _smote(majority_ratio, k_neighbors, random_state):
+    # Undersample first, so the synthetic rows, and the neighbour searches,
+    # are bounded by the minority class size rather than the data set
+    return Pipeline([
+        ('undersample', _undersample(majority_ratio, k_neighbors, random_state))
+        ,('smote', SMOTE(k_neighbors=k_neighbors, random_state=random_state))
+    ])
+
+def _smoteenn(majority_ratio, k_neighbors, random_state):
+    # The edited nearest neighbours pass searches every row - slow on the
+    # full history
+    return SMOTEENN(random_state=random_state)
+
+# Strategy name to a function building its sampler. None leaves the data as
+# it is; class_weight balances through the estimator instead.
+STRATEGIES = {
+    'none' : None
+    ,'class_weight' : None
+    ,'undersample' : _undersample
+    ,'smote' : _smote
+    ,'smoteenn' : _smoteenn
+}
+
+def balance(y):
+    '''
+    Row count of each class.
+    '''
+    return {int(k) : int(v) for k, v in enumerate(np.bincount(np.asarray(y, dtype=np.int64)))}
+
+class Resampler(BaseEstimator):
+    '''
+    Resamples with one of STRATEGIES. After fit_resample, report_ holds the
+    cost, in seconds, and the class balance before and after.
+    '''
+    def __init__(self, strategy='undersample', majority_ratio=3.0, k_neighbors=5, random_state=0):
+        self.strategy = strategy
+        self.majority_ratio = majority_ratio
+        self.k_neighbors = k_neighbors
+        self.random_state = random_state
+
+    def sampler(self):
+        if self.strategy not in STRATEGIES:
+            raise ValueError('Unknown resampling strategy: {}'.format(self.strategy))
+        build = STRATEGIES[self.strategy]
+        if build is None:
+            return None
+        return build(self.majority_ratio, self.k_neighbors, self.random_state)
+
+    def fit(self, x, y, **params):
+        self.fit_resample(x, y)
+        return self
+
+    def fit_resample(self, x, y, **params):
+        start = time.perf_counter()
+        sampler = self.sampler()
+        x_out, y_out = (x, y) if sampler is None else sampler.fit_resample(x, y)
+        self.report_ = {
+            'strategy' : self.strategy
+            ,'seconds' : time.perf_counter() - start
+            ,'rows_in' : len(y)
+            ,'rows_out' : len(y_out)
+            ,'balance_in' : balance(y)
+            ,'balance_out' : balance(y_out)
+        }
+        log.info('Resampled with %s in %.2fs: %s -> %s', self.strategy, self.report_['seconds']
+                 ,self.report_['balance_in'], self.report_['balance_out'])
+        return x_out, y_out
+
+def pipeline(estimator, strategy='undersample', **params):
+    '''
+    The estimator, behind a Resampler. With the class_weight strategy, the
+    estimator is set to balance the classes itself.
+    '''
+    if strategy == 'class_weight':
+        estimator.set_params(class_weight='balanced')
+    return Pipeline([
+        ('resample', Resampler(strategy, **params))
+        ,('model', estimator)
+    ])
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 23:48:30 2026
+
+@author: dgill
+@description: Deterministic sampling for development runs, set with
+              SAMPLE_FRACTION or SAMPLE_ROWS in the config file. Within each
+              foreclosure status and vintage, the loans with the lowest
+              hashes of their ids are kept. The hashes don't depend on the
+              machine or the run, so every run draws the same loans, and a
+              smaller sample is a subset of a larger one.
+"""
+
+import numpy as np
+import pandas as pd
+import settings as st
+
+def fraction(rows=None):
+    '''
+    The share of the loans kept - SAMPLE_FRACTION, lowered to meet the
+    SAMPLE_ROWS cap when rows, the loan count, is given. 1.0 keeps them all.
+    '''
+    share = st.SAMPLE_FRACTION or 1.0
+    if st.SAMPLE_ROWS and rows:
+        share = min(share, st.SAMPLE_ROWS / rows)
+    return min(1.0, float(share))
+
+def id_hash(ids):
+    # hash_pandas_object hashes with a fixed key, unlike the builtin hash
+    return pd.util.hash_pandas_object(pd.Series(ids), index=False).values
+
+def stratified(frame, share, strata=None):
+    '''
+    Keep share of the loans of each stratum, by default each combination of
+    TARGET and VINTAGE, rounded up so no stratum is emptied. The loans kept
+    are those with the lowest id hashes.
+    '''
+    if share >= 1.0 or len(frame) == 0:
+        return frame
+    strata = [c for c in (strata or [st.TARGET, st.VINTAGE]) if c in frame.columns]
+    keys = id_hash(frame['id'].values)
+    if strata:
+        codes = frame.groupby(strata, sort=False, dropna=False).ngroup().values
+    else:
+        codes = np.zeros(len(frame), dtype=np.int64)
+    # Sort by stratum, then hash, and keep the head of each stratum
+    order = np.lexsort((keys, codes))
+    starts = np.r_[0, np.flatnonzero(np.diff(codes[order])) + 1]
+    sizes = np.diff(np.r_[starts, len(order)])
+    position = np.arange(len(order)) - np.repeat(starts, sizes)
+    keep = np.zeros(len(frame), dtype=bool)
+    keep[order[position < np.repeat(np.ceil(sizes * share), sizes)]] = True
+    return frame[keep]
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 21:34:52 2026
+
+@author: dgill
+@description: Batch scoring of new acquisition files. The file is streamed in
+              chunks through the same feature logic as the transform, using
+              the persisted category codes and imputation statistics, and the
+              default probability of each loan is written to the
+              scores/<quarter> DIW dataset, one partition per chunk. Memory is
+              bounded by the chunk size.
+"""
+
+import os
+import sys
+import time
+import logging
+import pandas as pd
+import settings as st
+import storage
+import extract as e
+import transform as t
+import categories
+import impute
+import instrument
+import train as tr
+
+log = logging.getLogger('score')
+
+def check_artifact(artifact):
+    '''
+    New loans have no performance history, so a model using the performance
+    summary can't score them.
+    '''
+    history = [p for p in artifact['predictors'] if p in t.SUMMARY_DEFAULTS]
+    if history:
+        raise ValueError('Model {} uses performance history predictors, {}; train it with '
+                         'them in MODEL_PARAMS exclude to score new acquisitions'
+                         .format(artifact['key'], ', '.join(history)))
+
+def score_chunk(chunk, artifact, store, stats):
+    '''
+    Default probabilities for a chunk of raw acquisition records, from their
+    acquisition time features alone.
+    '''
+    acquisition = t.compact(chunk, st.COMPACT_DTYPES['Acquisition'])
+    acquisition = t.features(acquisition, store, stats)
+    x = t.predictor_matrix(acquisition, artifact['predictors'])
+    return pd.DataFrame({
+        'id' : acquisition['id'].values
+        ,'default_probability' : artifact['model'].predict_proba(x)[:, 1]
+    })
+
+@instrument.timed('score', logger=log)
+def score(path, key=None, chunksize=None):
+    '''
+    Score an Acquisition_YYYYQn.txt file with the model artifact key (by
+    default the last one trained). Returns the output dataset's name, and
+    the throughput.
+    '''
+    chunksize = chunksize or st.CHUNK_SIZE
+    artifact = tr.load_artifact(key)
+    check_artifact(artifact)
+    store = categories.load()
+    stats = impute.load()
+    name = os.path.join('scores', e.quarter(path))
+    storage.remove(name)
+    loans = 0
+    start = time.perf_counter()
+    for i, chunk in enumerate(e.read_file(path, 'Acquisition', chunksize=chunksize)):
+        with instrument.step('chunk_%05d' % i, len(chunk), log) as record:
+            scores = score_chunk(chunk, artifact, store, stats)
+            storage.write(scores, name, partition='%05d' % i)
+            record.rows_out = len(scores)
+        loans += len(scores)
+    seconds = time.perf_counter() - start
+    result = {
+        'dataset' : name
+        ,'model' : artifact['key']
+        ,'loans' : loans
+        ,'seconds' : seconds
+        ,'loans_per_sec' : loans / seconds if seconds > 0 else None
+        ,'peak_rss_mb' : instrument.peak_rss()
+    }
+    log.info('Scored %d loans with model %s in %.2fs, %.0f loans/sec', loans, artifact['key']
+             ,seconds, result['loans_per_sec'] or 0)
+    return result
+
+if __name__ == '__main__':
+    # python score.py <path to Acquisition_YYYYQn.txt> [model key]
+    print(score(*sys.argv[1:3]))
@@ -9,7 +9,10 @@ _DEBUG = True
 DATA_DIR = 'D:\\School\\Machine Learning\\fnma_loan_performance\\data\\landing'
 DIW_DIR = 'D:\\School\Machine Learning\\fnma_loan_performance\\data\\diw'
 CATEGORY_MAPPING_DIR = 'D:\\School\Machine Learning\\fnma_loan_performance\\output\\category_mappings'
+IMPUTATION_DIR = 'D:\\School\Machine Learning\\fnma_loan_performance\\output\\imputation'
 FEATURE_SELECTION_DIR = 'D:\\School\Machine Learning\\fnma_loan_performance\\output\\feature_selection'
+MODEL_DIR = 'D:\\School\Machine Learning\\fnma_loan_performance\\output\\models'
+BENCHMARK_DIR = 'D:\\School\Machine Learning\\fnma_loan_performance\\output\\benchmarks'
 PACKAGE_PATH = 'D:\\School\\Machine Learning\\fnma_loan_performance\\packages'
 # All of the headers in the two files
 HEADERS = {
@@ -74,15 +77,126 @@ HEADERS = {
         "servicing_activity_indicator"
     ]
 }
+# Parse types for each column in the two files. The readers only apply the
+# types for the columns in SELECT, so they never tokenize the rest.
+DTYPES = {
+    "Acquisition": {
+        "id": "int64",
+        "channel": "object",
+        "seller": "object",
+        "interest_rate": "float64",
+        "balance": "float64",
+        "loan_term": "float64",
+        "origination_date": "object",
+        "first_payment_date": "object",
+        "ltv": "float64",
+        "cltv": "float64",
+        "borrower_count": "float64",
+        "dti": "float64",
+        "borrower_credit_score": "float64",
+        "first_time_homebuyer": "object",
+        "loan_purpose": "object",
+        "property_type": "object",
+        "unit_count": "float64",
+        "occupancy_status": "object",
+        "property_state": "object",
+        "zip": "float64",
+        "insurance_percentage": "float64",
+        "product_type": "object",
+        "co_borrower_credit_score": "float64",
+        "mortgage_insurance_type": "float64",
+        "relocation_mortgage_indicator": "object"
+    },
+    "Performance": {
+        "id": "int64",
+        "reporting_period": "object",
+        "servicer_name": "object",
+        "interest_rate": "float64",
+        "balance": "float64",
+        "loan_age": "float64",
+        "months_to_maturity": "float64",
+        "adj_months_to_maturity": "float64",
+        "maturity_date": "object",
+        "msa": "float64",
+        "delinquency_status": "object",
+        "modification_flag": "object",
+        "zero_balance_code": "object",
+        "zero_balance_date": "object",
+        "last_paid_installment_date": "object",
+        "foreclosure_date": "object",
+        "disposition_date": "object",
+        "foreclosure_costs": "float64",
+        "property_repair_costs": "float64",
+        "recovery_costs": "float64",
+        "misc_costs": "float64",
+        "tax_costs": "float64",
+        "sale_proceeds": "float64",
+        "credit_enhancement_proceeds": "float64",
+        "repurchase_proceeds": "float64",
+        "other_foreclosure_proceeds": "float64",
+        "non_interest_bearing_balance": "float64",
+        "principal_forgiveness_balance": "float64",
+        "repurchase_flag": "object",
+        "foreclocure_principal_writeoff_amt": "float64",
+        "servicing_activity_indicator": "object"
+    }
+}
+# Compact in memory types for the acquisition data, applied when the
+# transform reads it. Low cardinality strings are categories, integers use the
+# nullable types (so nulls stay nulls, rather than -1), and floats are 32 bit.
+COMPACT_DTYPES = {
+    "Acquisition": {
+        "id": "int64",
+        "channel": "category",
+        "seller": "category",
+        "interest_rate": "float32",
+        "balance": "float32",
+        "loan_term": "Int16",
+        "origination_date": "category",
+        "first_payment_date": "category",
+        "ltv": "Int16",
+        "cltv": "Int16",
+        "borrower_count": "Int8",
+        "dti": "Int16",
+        "borrower_credit_score": "Int16",
+        "first_time_homebuyer": "category",
+        "loan_purpose": "category",
+        "property_type": "category",
+        "unit_count": "Int8",
+        "occupancy_status": "category",
+        "property_state": "category",
+        "zip": "Int16",
+        "insurance_percentage": "float32",
+        "product_type": "category",
+        "co_borrower_credit_score": "Int16",
+        "mortgage_insurance_type": "Int8",
+        "relocation_mortgage_indicator": "category"
+    }
+}
 # The select list consists of the columns we wish to keep
 SELECT = {
     "Acquisition": HEADERS["Acquisition"],
     "Performance": [
         "id",
+        "loan_age",
+        "balance",
+        "delinquency_status",
+        "modification_flag",
         "foreclosure_date"
     ]
 }
 TARGET = 'foreclosure_status'
+# Columns cast to numeric category codes
+CATEGORY_COLS = [
+    'channel'
+    ,'seller'
+    ,'first_time_homebuyer'
+    ,'loan_purpose'
+    ,'property_type'
+    ,'occupancy_status'
+    ,'property_state'
+    ,'product_type'
+]
 DROP_COLS = [
     'origination_date'
     ,'first_payment_date'
@@ -92,12 +206,110 @@ DROP_COLS = [
     ,'relocation_mortgage_indicator'
     ,'product_type'        
 ]
+# Columns with nulls filled, and the bounds of the histogram used to estimate
+# their medians
+IMPUTE_COLS = {
+    'borrower_credit_score' : (300, 850)
+    ,'borrower_count' : (1, 10)
+    ,'cltv' : (0, 200)
+    ,'dti' : (0, 100)
+}
+# How nulls are filled - 'mean', 'median', or 'group_mean', the mean for the
+# loan's IMPUTE_GROUPS values
+IMPUTE_STRATEGY = 'mean'
+IMPUTE_GROUPS = ['property_state', 'loan_purpose']
+# How the MM/YYYY dates are turned into features - 'month_year' adds a month
+# and a year column for each date, 'months' adds a months since 1970 column
+DATE_ENCODING = 'month_year'
+# Development sampling, usually set in the config file. SAMPLE_FRACTION is
+# the share of the loans transformed, and SAMPLE_ROWS caps their number (0
+# for no cap). The sample is stratified on TARGET and VINTAGE, and drawn by
+# hashing the loan ids, so it's the same on every machine; see sampling.
+SAMPLE_FRACTION = 1.0
+SAMPLE_ROWS = 0
+# Months of each loan's life, by loan age, the delinquency, modification,
+# and balance features are computed over. Later records are left out, so the
+# features don't describe the run up to a foreclosure. The foreclosure status
+# and performance count still cover the whole history. 0 uses every month.
+OBSERVATION_MONTHS = 12
+# Column holding the quarter of the acquisition file each loan came from, e.g.
+# 2007Q1 - not the quarter of its origination_date. The training data is
+# partitioned by it, so reads of a range of vintages only open those
+# partitions.
+VINTAGE = 'vintage'
 # TODO: reduce the predictor count
-NON_PRED = [TARGET, "id"]
+NON_PRED = [TARGET, "id", VINTAGE]
 FOLDS = 3
 # Minimum # of quarters a loan must be in the dataset for inclusion
 MINIMUM_QUARTER_COUNT = 4
 DROP_DATA_AFTER_TRAINING = False
+# Columns summarizing a loan's performance history. New acquisitions have
+# none, so a model used for scoring can't depend on them.
+PERFORMANCE_FEATURES = [
+    'performance_count'
+    ,'max_delinquency'
+    ,'months_30_dpd'
+    ,'months_60_dpd'
+    ,'months_90_dpd'
+    ,'first_delinquency_age'
+    ,'modification_flag'
+    ,'last_balance'
+]
+# Hyperparameters for train.train_model. Columns in exclude are left out of
+# the predictors, along with NON_PRED. resample is one of the strategies in
+# resample.STRATEGIES - 'undersample', 'smote' (over majority_ratio
+# undersampled data), 'smoteenn', 'class_weight', or 'none'. majority_ratio
+# is the majority rows kept per minority row when undersampling.
+MODEL_PARAMS = {
+    'n_estimators' : 200
+    ,'test_size' : 0.25
+    ,'random_state' : 0
+    ,'exclude' : ['ltv', 'product_type'] + PERFORMANCE_FEATURES
+    ,'resample' : 'smote'
+    ,'majority_ratio' : 3.0
+    ,'k_neighbors' : 5
+}
+# Read the zip members directly, rather than extracting them to disk
+STREAM_ZIP = True
+# Only ingest, and summarize, quarterly files which are new or changed
+INCREMENTAL = True
+# Number of processes used to parse the quarterly files
+INGEST_WORKERS = 4
+# Choose the model's predictors with RFE. The results are cached in
+# FEATURE_SELECTION_DIR; RFE runs over a stratified sample of at most
+# FEATURE_SELECTION_SAMPLE rows (0 uses every row).
 DYNAMIC_FEATURE_SELECTION = False
+FEATURE_SELECTION_COUNT = 5
+FEATURE_SELECTION_SAMPLE = 250000
+# Storage format for the DIW layer - one of parquet, feather, csv, or sqlite
+DIW_FORMAT = 'parquet'
+DIW_COMPRESSION = {
+    'parquet' : 'snappy'
+    ,'feather' : 'lz4'
+}
+# sqlite DIW only - rows per executemany batch, and the columns indexed once
+# a dataset is loaded. Every dataset is also indexed on its partition, which
+# for Acquisition and Performance is the acquisition file's quarter.
+SQLITE_BATCH = 10000
+SQLITE_INDEXES = ['id', 'property_state']
+# Number of loan id hash partitions the transform runs over, 0 transforms
+# the whole data set in memory
+XFORM_PARTITIONS = 0
+# How the performance summaries are joined to the acquisition data - 'hash'
+# factorizes the loan ids, 'sorted' ingests each quarter sorted by id, and
+# merge joins the quarters' acquisition and performance streams
+JOIN_MODE = 'hash'
+# Rows per chunk when streaming a dataset
+CHUNK_SIZE = 1000000
+# Also write the training data out as csv
+EXPORT_CSV = False
+# Pipeline log, and an optional JSON lines trace of every instrumented step
+LOG_FILE = 'D:\\School\Machine Learning\\fnma_loan_performance\\output\\logs\\pipeline.log'
+TRACE_FILE = None
+# joblib backend the models are cross validated and fit with - 'loky'
+# (processes), 'threading', 'multiprocessing', or 'sequential' - and its
+# worker count. -1 uses every core.
+EXECUTION_BACKEND = 'loky'
+WORKERS = -1
 CONFIG_DIR = 'config'
 CONFIG_FILE = 'app.conf'
@@ -7,6 +7,19 @@ Created on Sun Apr 29 11:52:32 2018
 
 import sys, os
 import settings as st
+from janitor import ConfigFile, ConfigNode
+
+# Settings which may be overridden from the configuration file. The paths are
+# computed at run time, so they aren't taken from the file.
+CONFIG_KEYS = [
+    '_DEBUG'
+    ,'EXECUTION_BACKEND'
+    ,'WORKERS'
+    ,'FOLDS'
+    ,'INGEST_WORKERS'
+    ,'SAMPLE_FRACTION'
+    ,'SAMPLE_ROWS'
+]
 
 class Configuration(object):
     pass
@@ -135,6 +148,43 @@ def config_settings():
     st.DIW_DIR = _diw_path
     st.PACKAGE_PATH = _package_path
 
+def load_config(path=None, keys=None):
+    '''
+    Apply the settings in keys (CONFIG_KEYS by default) from the
+    configuration file. Settings missing from the file, or a missing file,
+    leave the defaults in settings.py. Returns the settings applied.
+    '''
+    keys = keys or CONFIG_KEYS
+    try:
+        path = path or get_config_file_dir()
+        config = ConfigFile(path, load=True)
+    except (IOError, FileNotFoundError):
+        return {}
+    applied = {}
+    for key in keys:
+        if key in config:
+            value = config[key]
+            if isinstance(value, ConfigNode):
+                value = value.to_dict()
+            setattr(st, key, value)
+            applied[key] = value
+    return applied
+
+def settings_snapshot():
+    '''
+    Copy the current settings, so they can be handed to worker processes. On
+    platforms which spawn workers, the settings module is re-imported, and
+    anything set at run time (like the paths) would be lost.
+    '''
+    return {k : getattr(st, k) for k in dir(st) if k.isupper() or k == '_DEBUG'}
+
+def apply_settings(snapshot):
+    '''
+    Apply a snapshot from settings_snapshot. Used as a process pool initializer.
+    '''
+    for k, v in snapshot.items():
+        setattr(st, k, v)
+
 def set_features(features):
     ftr_lst = [f for f in st.HEADERS['Acquisition'] if f not in features]
     for ftr in ftr_lst:
@@ -148,6 +198,7 @@ def setup():
     # TODO: Error check setup before and after function calls
     print('[+] Configuring application evnironment')
     config_settings()
+    load_config()
     config_path()
     
 if __name__ == '__main__':
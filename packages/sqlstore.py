@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 22:25:43 2026
+
+@author: dgill
+@description: SQLite backend for the DIW layer, used by storage when
+              DIW_FORMAT is sqlite. Every dataset is a table in
+              DIW_DIR/diw.sqlite, with its partition in a _partition column.
+              Rows are loaded with batched executemany in WAL mode, and the
+              indexes in SQLITE_INDEXES are only built once a load finishes
+              (finalize), so point lookups by loan id, and vintage or state
+              slices, don't scan the table.
+"""
+
+import os
+import json
+import time
+import sqlite3
+from contextlib import closing
+import numpy as np
+import pandas as pd
+import settings as st
+
+PARTITION = '_partition'
+# Partition value for datasets which aren't partitioned
+SINGLE = ''
+OPERATORS = ['==', '!=', '<', '<=', '>', '>=', 'in', 'not in']
+
+def path():
+    return os.path.join(st.DIW_DIR, 'diw.sqlite')
+
+def connect():
+    os.makedirs(st.DIW_DIR, exist_ok=True)
+    # Worker processes write concurrently, so wait on the lock rather than fail
+    conn = sqlite3.connect(path(), timeout=300)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('CREATE TABLE IF NOT EXISTS _datasets (dataset TEXT PRIMARY KEY, dtypes TEXT)')
+    conn.execute('CREATE TABLE IF NOT EXISTS _partitions (dataset TEXT, partition TEXT, rows INTEGER'
+                 ', written REAL, PRIMARY KEY (dataset, partition))')
+    return conn
+
+def table(name):
+    # Dataset names are paths, so the separator is normalized
+    return name.replace('\\', '/')
+
+def quote(identifier):
+    return '"{}"'.format(identifier.replace('"', '""'))
+
+def sql_type(dtype):
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    return 'TEXT'
+
+def dtypes(conn, name):
+    row = conn.execute('SELECT dtypes FROM _datasets WHERE dataset = ?', (table(name),)).fetchone()
+    return None if row is None else json.loads(row[0])
+
+def drop(conn, name):
+    conn.execute('DROP TABLE IF EXISTS {}'.format(quote(table(name))))
+    conn.execute('DELETE FROM _datasets WHERE dataset = ?', (table(name),))
+    conn.execute('DELETE FROM _partitions WHERE dataset = ?', (table(name),))
+
+def rows(frame):
+    '''
+    The frame as tuples, with nulls as None, and numpy scalars as Python ones.
+    '''
+    values = frame.astype(object).where(frame.notna(), None)
+    for row in values.itertuples(index=False, name=None):
+        yield tuple(v.item() if isinstance(v, np.generic) else v for v in row)
+
+def write(frame, name, partition=None):
+    '''
+    Replace a partition of the dataset (or the whole dataset, if partition is
+    None) with the frame. A frame with different columns replaces the table.
+    '''
+    partition = SINGLE if partition is None else str(partition)
+    schema = {c : str(d) for c, d in frame.dtypes.items()}
+    with closing(connect()) as conn, conn:
+        conn.execute('BEGIN IMMEDIATE')
+        current = dtypes(conn, name)
+        if partition == SINGLE or (current is not None and list(current) != list(schema)):
+            drop(conn, name)
+            current = None
+        if current is None:
+            cols = ', '.join('{} {}'.format(quote(c), sql_type(d)) for c, d in frame.dtypes.items())
+            conn.execute('CREATE TABLE {} ({} TEXT, {})'.format(quote(table(name)), PARTITION, cols))
+            conn.execute('INSERT INTO _datasets VALUES (?, ?)', (table(name), json.dumps(schema)))
+        conn.execute('DELETE FROM {} WHERE {} = ?'.format(quote(table(name)), PARTITION), (partition,))
+        insert = 'INSERT INTO {} VALUES ({})'.format(quote(table(name))
+                                                    ,', '.join(['?'] * (len(schema) + 1)))
+        for start in range(0, len(frame), st.SQLITE_BATCH):
+            batch = frame.iloc[start:start + st.SQLITE_BATCH]
+            conn.executemany(insert, ((partition,) + r for r in rows(batch)))
+        conn.execute('INSERT OR REPLACE INTO _partitions VALUES (?, ?, ?, ?)'
+                     ,(table(name), partition, len(frame), time.time()))
+    return path()
+
+def finalize(name):
+    '''
+    Build the indexes on a dataset once it's loaded.
+    '''
+    with closing(connect()) as conn, conn:
+        current = dtypes(conn, name)
+        if current is None:
+            return
+        for col in [PARTITION] + [c for c in st.SQLITE_INDEXES if c in current]:
+            conn.execute('CREATE INDEX IF NOT EXISTS {} ON {} ({})'.format(
+                quote('ix_{}_{}'.format(table(name), col)), quote(table(name)), quote(col)))
+
+def remove(name):
+    '''
+    Drop a dataset, and any datasets nested under it.
+    '''
+    with closing(connect()) as conn, conn:
+        names = [r[0] for r in conn.execute('SELECT dataset FROM _datasets')]
+        for n in names:
+            if n == table(name) or n.startswith(table(name) + '/'):
+                drop(conn, n)
+
+def remove_partition(name, partition):
+    partition = SINGLE if partition is None else str(partition)
+    with closing(connect()) as conn, conn:
+        if dtypes(conn, name) is None:
+            return
+        conn.execute('DELETE FROM {} WHERE {} = ?'.format(quote(table(name)), PARTITION), (partition,))
+        conn.execute('DELETE FROM _partitions WHERE dataset = ? AND partition = ?'
+                     ,(table(name), partition))
+
+def list_partitions(name):
+    with closing(connect()) as conn:
+        return [r[0] for r in conn.execute('SELECT partition FROM _partitions WHERE dataset = ?'
+                                           ' AND partition != ? ORDER BY partition'
+                                           ,(table(name), SINGLE))]
+
+def is_single(name):
+    with closing(connect()) as conn:
+        return conn.execute('SELECT 1 FROM _partitions WHERE dataset = ? AND partition = ?'
+                            ,(table(name), SINGLE)).fetchone() is not None
+
+def written(name, partition):
+    partition = SINGLE if partition is None else str(partition)
+    with closing(connect()) as conn:
+        row = conn.execute('SELECT written FROM _partitions WHERE dataset = ? AND partition = ?'
+                           ,(table(name), partition)).fetchone()
+    return None if row is None else row[0]
+
+def where(partitions=None, filters=None):
+    '''
+    WHERE clause, and its parameters, for the partitions and filters. Filters
+    are (column, operator, value) tuples, with an operator in OPERATORS.
+    '''
+    clauses, params = [], []
+    if partitions is not None:
+        clauses.append('{} IN ({})'.format(PARTITION, ', '.join(['?'] * len(partitions))))
+        params.extend(str(p) for p in partitions)
+    for col, op, value in filters or []:
+        if op not in OPERATORS:
+            raise ValueError('Unknown filter operator: {}'.format(op))
+        if op in ('in', 'not in'):
+            value = list(value)
+            clauses.append('{} {} ({})'.format(quote(col), op.upper(), ', '.join(['?'] * len(value))))
+            params.extend(v.item() if isinstance(v, np.generic) else v for v in value)
+        else:
+            clauses.append('{} {} ?'.format(quote(col), '=' if op == '==' else op))
+            params.append(value.item() if isinstance(value, np.generic) else value)
+    return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+def restore(frame, schema):
+    '''
+    Cast the columns back to the types they were written with.
+    '''
+    types = {c : schema[c] for c in frame.columns if c in schema}
+    for c, d in list(types.items()):
+        # Whole numbers with nulls come back as floats, and strings as objects
+        if d in ('int64', 'int32', 'int16', 'int8') and frame[c].isna().any():
+            types[c] = d.capitalize()
+        elif d == 'bool' and frame[c].isna().any():
+            types[c] = 'boolean'
+    return frame.astype(types)
+
+def iter_chunks(name, columns=None, partitions=None, chunksize=None, filters=None):
+    '''
+    Yield (partition, frame) for a dataset, in frames of at most chunksize
+    rows, with the filters run by SQLite.
+    '''
+    chunksize = chunksize or st.CHUNK_SIZE
+    with closing(connect()) as conn:
+        schema = dtypes(conn, name)
+        if schema is None:
+            return
+        cols = columns or list(schema)
+        if partitions is None:
+            partitions = list_partitions(name) or [None]
+        for p in partitions:
+            clause, params = where(None if p is None else [p], filters)
+            cursor = conn.execute('SELECT {} FROM {}{} ORDER BY rowid'.format(
+                ', '.join(quote(c) for c in cols), quote(table(name)), clause), params)
+            while True:
+                batch = cursor.fetchmany(chunksize)
+                if not batch:
+                    break
+                yield p, restore(pd.DataFrame.from_records(batch, columns=cols), schema)
+
+def read(name, columns=None, partitions=None, filters=None):
+    frames = [frame for _, frame in iter_chunks(name, columns, partitions, filters=filters)]
+    if len(frames) == 0:
+        with closing(connect()) as conn:
+            schema = dtypes(conn, name)
+        if schema is None:
+            raise FileNotFoundError('No data found for dataset: {}'.format(name))
+        cols = columns or list(schema)
+        return restore(pd.DataFrame({c : pd.Series([], dtype=object) for c in cols}), schema)
+    return pd.concat(frames, axis=0, ignore_index=True)
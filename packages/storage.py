@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 11:02:15 2026
+
+@author: dgill
+@description: Storage for the DIW layer. A dataset is either a single file,
+              DIW_DIR/<name>.<ext>, or a directory of partitions,
+              DIW_DIR/<name>/<partition>.<ext>. The format is set with
+              settings.DIW_FORMAT; parquet and feather keep the column types
+              and support reading a subset of the columns. CSV remains
+              available for exports. With sqlite, every dataset is instead a
+              table in a single indexed database; see sqlstore.
+              Reads take filters, (column, operator, value) tuples, which
+              parquet and sqlite apply as they read. The row count, and each
+              column's nulls, min and max, of every partition are kept in
+              DIW_DIR/<name>/_metadata.json, and partitions which can't match
+              the filters are skipped without being opened.
+"""
+
+import os
+import json
+import shutil
+import operator
+import numpy as np
+import pandas as pd
+import settings as st
+import sqlstore
+
+try:
+    import pyarrow.parquet as pq
+    import pyarrow.feather as feather
+    HAVE_PYARROW = True
+except ImportError:
+    HAVE_PYARROW = False
+
+EXTENSIONS = {
+    'csv' : '.csv'
+    ,'parquet' : '.parquet'
+    ,'feather' : '.feather'
+    ,'sqlite' : '.sqlite'
+}
+FILTER_OPERATORS = {
+    '==' : operator.eq
+    ,'!=' : operator.ne
+    ,'<' : operator.lt
+    ,'<=' : operator.le
+    ,'>' : operator.gt
+    ,'>=' : operator.ge
+    ,'in' : lambda s, v: s.isin(list(v))
+    ,'not in' : lambda s, v: ~s.isin(list(v))
+}
+# Whether a column with the (min, max, nulls) statistics may hold values
+# passing each filter. Nulls pass the negated filters in pandas.
+RANGE_TESTS = {
+    '==' : lambda lo, hi, nulls, v: lo <= v <= hi
+    ,'!=' : lambda lo, hi, nulls, v: nulls > 0 or not lo == hi == v
+    ,'<' : lambda lo, hi, nulls, v: lo < v
+    ,'<=' : lambda lo, hi, nulls, v: lo <= v
+    ,'>' : lambda lo, hi, nulls, v: hi > v
+    ,'>=' : lambda lo, hi, nulls, v: hi >= v
+    ,'in' : lambda lo, hi, nulls, v: any(lo <= x <= hi for x in v)
+    ,'not in' : lambda lo, hi, nulls, v: nulls > 0 or not (lo == hi and lo in list(v))
+}
+METADATA = '_metadata.json'
+
+def get_format(fmt=None):
+    '''
+    Validate the storage format, defaulting to settings.DIW_FORMAT.
+    '''
+    fmt = fmt or st.DIW_FORMAT
+    if fmt not in EXTENSIONS:
+        raise ValueError('Unknown DIW format: {}'.format(fmt))
+    if fmt in ('parquet', 'feather') and not HAVE_PYARROW:
+        raise ImportError('pyarrow is required for the {} format'.format(fmt))
+    return fmt
+
+def path(name, partition=None, fmt=None):
+    fmt = get_format(fmt)
+    if fmt == 'sqlite':
+        return sqlstore.path()
+    ext = EXTENSIONS[fmt]
+    if partition is None:
+        return os.path.join(st.DIW_DIR, name + ext)
+    return os.path.join(st.DIW_DIR, name, str(partition) + ext)
+
+def exists(name, fmt=None):
+    if get_format(fmt) == 'sqlite':
+        return sqlstore.is_single(name) or len(sqlstore.list_partitions(name)) > 0
+    return os.path.exists(path(name, fmt=fmt)) or len(list_partitions(name, fmt)) > 0
+
+def is_current(name, partition, source, fmt=None):
+    '''
+    Whether a partition, derived from the same partition of source, was
+    written after it.
+    '''
+    if get_format(fmt) == 'sqlite':
+        mine, theirs = sqlstore.written(name, partition), sqlstore.written(source, partition)
+        return mine is not None and theirs is not None and mine >= theirs
+    pth = path(name, partition, fmt)
+    return os.path.exists(pth) \
+        and os.path.getmtime(pth) >= os.path.getmtime(path(source, partition, fmt))
+
+def list_partitions(name, fmt=None):
+    '''
+    Sorted partition names of a partitioned dataset.
+    '''
+    fmt = get_format(fmt)
+    if fmt == 'sqlite':
+        return sqlstore.list_partitions(name)
+    ext = EXTENSIONS[fmt]
+    pth = os.path.join(st.DIW_DIR, name)
+    if not os.path.isdir(pth):
+        return []
+    return [f[:-len(ext)] for f in sorted(os.listdir(pth)) if f.endswith(ext)]
+
+def scalar(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+def column_stats(series):
+    '''
+    Null count, and the min and max where the values can be ordered.
+    '''
+    stats = {'nulls' : int(series.isna().sum())}
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return stats
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.values
+        values = pd.Series(series.cat.categories[np.unique(codes[codes >= 0])])
+    else:
+        values = series.dropna()
+    if len(values) == 0:
+        return stats
+    try:
+        stats['min'], stats['max'] = scalar(values.min()), scalar(values.max())
+    except TypeError:
+        pass
+    return stats
+
+def partition_stats(frame):
+    return {
+        'rows' : len(frame)
+        ,'columns' : {c : column_stats(frame[c]) for c in frame.columns}
+    }
+
+def metadata_path(name):
+    return os.path.join(st.DIW_DIR, name, METADATA)
+
+def load_metadata(name):
+    '''
+    Statistics of each partition of a dataset, keyed by partition.
+    '''
+    pth = metadata_path(name)
+    if not os.path.exists(pth):
+        return {}
+    with open(pth, 'r') as f:
+        return json.load(f)
+
+def update_metadata(name, partition, stats):
+    '''
+    Record a partition's statistics. Not safe to call from several processes
+    at once, so parallel writers pass their statistics back to the parent.
+    '''
+    meta = load_metadata(name)
+    meta[str(partition)] = stats
+    save_metadata(name, meta)
+
+def save_metadata(name, meta):
+    pth = metadata_path(name)
+    os.makedirs(os.path.dirname(pth), exist_ok=True)
+    with open(pth + '.tmp', 'w') as f:
+        json.dump(meta, f, indent=1, sort_keys=True, default=str)
+    os.replace(pth + '.tmp', pth)
+
+def may_match(stats, filters):
+    '''
+    Whether a partition with the statistics may hold rows passing every
+    filter. Without statistics, it may.
+    '''
+    if stats is None:
+        return True
+    if stats['rows'] == 0:
+        return False
+    for col, op, value in filters:
+        col_stats = stats['columns'].get(col, {})
+        if 'min' not in col_stats:
+            continue
+        # A string can't match a numeric column - parquet raises, and sqlite
+        # and csv return nothing. In train, the category columns hold codes
+        if isinstance(col_stats['min'], (int, float)) and any(
+                isinstance(v, str) for v in (value if op in ('in', 'not in') else [value])):
+            raise ValueError('Filter ({}, {}, {!r}) compares a string with a numeric column. '
+                             'Filter the training data with train.read, which maps category '
+                             'values to their codes.'.format(col, op, value))
+        try:
+            if not RANGE_TESTS[op](col_stats['min'], col_stats['max'], col_stats['nulls'], value):
+                return False
+        except TypeError:
+            # Values which can't be compared with the statistics
+            continue
+    return True
+
+def prune(name, partitions=None, filters=None, fmt=None):
+    '''
+    The partitions to read, dropping those whose statistics rule out the
+    filters. None for a dataset stored whole.
+    '''
+    fmt = get_format(fmt)
+    if partitions is None:
+        single = sqlstore.is_single(name) if fmt == 'sqlite' else os.path.exists(path(name, fmt=fmt))
+        if single:
+            return None
+        partitions = list_partitions(name, fmt)
+    if not filters:
+        return partitions
+    meta = load_metadata(name)
+    keep = [p for p in partitions if may_match(meta.get(str(p)), filters)]
+    # One partition is still read when none match, for the columns and types
+    return keep or partitions[:1]
+
+def row_count(name, fmt=None):
+    '''
+    Rows in a dataset, from the partition statistics where they're recorded.
+    '''
+    partitions = prune(name, fmt=fmt)
+    if partitions is None:
+        return sum(len(frame) for _, frame in iter_chunks(name, fmt=fmt))
+    meta = load_metadata(name)
+    return sum(meta[p]['rows'] if p in meta
+               else sum(len(frame) for _, frame in iter_chunks(name, partitions=[p], fmt=fmt))
+               for p in partitions)
+
+def write(frame, name, partition=None, fmt=None, stats=True):
+    '''
+    Write a frame to the dataset, or to one of its partitions. Returns the
+    path written. The statistics of a partition are recorded unless stats is
+    False, when the caller records them with update_metadata.
+    '''
+    fmt = get_format(fmt)
+    if partition is not None and stats:
+        update_metadata(name, partition, partition_stats(frame))
+    if fmt == 'sqlite':
+        return sqlstore.write(frame, name, partition)
+    pth = path(name, partition, fmt)
+    os.makedirs(os.path.dirname(pth), exist_ok=True)
+    if fmt == 'parquet':
+        frame.to_parquet(pth, index=False, compression=st.DIW_COMPRESSION[fmt])
+    elif fmt == 'feather':
+        # Feather only stores a default index
+        frame.reset_index(drop=True).to_feather(pth, compression=st.DIW_COMPRESSION[fmt])
+    else:
+        frame.to_csv(pth, index=False)
+    return pth
+
+def remove(name, fmt=None):
+    '''
+    Remove a dataset, both its single file and its partitions.
+    '''
+    if get_format(fmt) == 'sqlite':
+        shutil.rmtree(os.path.join(st.DIW_DIR, name), ignore_errors=True)
+        return sqlstore.remove(name)
+    single = path(name, fmt=fmt)
+    if os.path.exists(single):
+        os.remove(single)
+    shutil.rmtree(os.path.join(st.DIW_DIR, name), ignore_errors=True)
+
+def remove_partition(name, partition, fmt=None):
+    '''
+    Remove one partition of a dataset, and its statistics.
+    '''
+    meta = load_metadata(name)
+    if str(partition) in meta:
+        del meta[str(partition)]
+        save_metadata(name, meta)
+    if get_format(fmt) == 'sqlite':
+        return sqlstore.remove_partition(name, partition)
+    pth = path(name, partition, fmt)
+    if os.path.exists(pth):
+        os.remove(pth)
+
+def apply_filters(frame, filters, columns=None):
+    '''
+    Keep the rows of a frame matching every filter, then the columns.
+    '''
+    if filters:
+        mask = pd.Series(True, index=frame.index)
+        for col, op, value in filters:
+            mask &= FILTER_OPERATORS[op](frame[col], value)
+        frame = frame[mask.values]
+    return frame if columns is None else frame[columns]
+
+def filter_columns(columns, filters):
+    '''
+    The columns to read, so the filters can be applied after reading.
+    '''
+    if columns is None or not filters:
+        return columns
+    return columns + [c for c, _, _ in filters if c not in columns]
+
+def read_file(pth, fmt=None, columns=None, filters=None):
+    fmt = get_format(fmt)
+    if fmt == 'parquet':
+        # pyarrow skips the row groups the filters rule out
+        return pd.read_parquet(pth, columns=columns, filters=filters or None)
+    elif fmt == 'feather':
+        frame = pd.read_feather(pth, columns=filter_columns(columns, filters))
+    else:
+        frame = pd.read_csv(pth, usecols=filter_columns(columns, filters))
+    # usecols does not keep the requested order
+    return apply_filters(frame, filters, columns).reset_index(drop=True)
+
+def read(name, columns=None, partitions=None, fmt=None, filters=None):
+    '''
+    Read a dataset, loading only the requested columns, and rows matching the
+    filters. The partitions of a partitioned dataset are concatenated, and
+    may be limited to a subset.
+    '''
+    fmt = get_format(fmt)
+    partitions = prune(name, partitions, filters, fmt)
+    if fmt == 'sqlite':
+        return sqlstore.read(name, columns, partitions, filters)
+    if partitions is None:
+        return read_file(path(name, fmt=fmt), fmt, columns, filters)
+    if len(partitions) == 0:
+        raise FileNotFoundError('No data found for dataset: {}'.format(name))
+    return pd.concat([read_file(path(name, p, fmt), fmt, columns, filters) for p in partitions]
+                     ,axis=0, ignore_index=True)
+
+def iter_file(pth, fmt=None, columns=None, chunksize=None, filters=None):
+    '''
+    Yield a file in frames of at most chunksize rows.
+    '''
+    fmt = get_format(fmt)
+    chunksize = chunksize or st.CHUNK_SIZE
+    read_columns = filter_columns(columns, filters)
+    if fmt == 'parquet':
+        for batch in pq.ParquetFile(pth).iter_batches(batch_size=chunksize, columns=read_columns):
+            yield apply_filters(batch.to_pandas(), filters, columns)
+    elif fmt == 'feather':
+        # The file is memory mapped, so only the batch being converted is read
+        table = feather.read_table(pth, columns=read_columns, memory_map=True)
+        for batch in table.to_batches(max_chunksize=chunksize):
+            yield apply_filters(batch.to_pandas(), filters, columns)
+    else:
+        for frame in pd.read_csv(pth, usecols=read_columns, chunksize=chunksize):
+            yield apply_filters(frame, filters, columns)
+
+def iter_chunks(name, columns=None, partitions=None, chunksize=None, fmt=None, filters=None):
+    '''
+    Yield (partition, frame) for a dataset, in frames of at most chunksize
+    rows, so memory is bounded by the chunk size rather than the dataset.
+    '''
+    fmt = get_format(fmt)
+    partitions = prune(name, partitions, filters, fmt)
+    if fmt == 'sqlite':
+        yield from sqlstore.iter_chunks(name, columns, partitions, chunksize, filters)
+        return
+    if partitions is None:
+        for frame in iter_file(path(name, fmt=fmt), fmt, columns, chunksize, filters):
+            yield None, frame
+        return
+    for p in partitions:
+        for frame in iter_file(path(name, p, fmt), fmt, columns, chunksize, filters):
+            yield p, frame
+
+def finalize(name, fmt=None):
+    '''
+    Called once a dataset is loaded. Builds the sqlite indexes; the file
+    formats have nothing to do.
+    '''
+    if get_format(fmt) == 'sqlite':
+        sqlstore.finalize(name)
+
+def export_csv(name, fmt=None):
+    '''
+    Export a dataset to DIW_DIR/<name>.csv. Partitions are appended one at a
+    time, so the whole dataset is never held in memory.
+    '''
+    fmt = get_format(fmt)
+    out = path(name, fmt='csv')
+    if fmt == 'sqlite':
+        for i, (_, frame) in enumerate(iter_chunks(name, fmt=fmt)):
+            frame.to_csv(out, index=False, mode='w' if i == 0 else 'a', header=i == 0)
+        return out
+    single = path(name, fmt=fmt)
+    if os.path.exists(single):
+        if fmt != 'csv':
+            read_file(single, fmt).to_csv(out, index=False)
+        return out
+    for i, p in enumerate(list_partitions(name, fmt)):
+        read_file(path(name, p, fmt), fmt).to_csv(out, index=False
+                                                 ,mode='w' if i == 0 else 'a'
+                                                 ,header=i == 0)
+    return out
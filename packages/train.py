@@ -3,19 +3,31 @@
 Created on Wed May  2 21:18:21 2018
 
 @author: dgill
+@description: Train the random forest on the training data. train_model fits
+              the model, and persists it in MODEL_DIR keyed by a hash of the
+              training data and the hyperparameters, so an identical call
+              loads it from disk rather than refitting.
 """
 
 import os
+import json
+import time
+import hashlib
+import logging
 import numpy as np
 import pandas as pd
+import joblib
 import settings as st
-import setup
+import storage
+import transform as t
+import model as m
+import resample
+import instrument
 
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-from imblearn.combine import SMOTEENN
-from sklearn.cross_validation import train_test_split
+from sklearn.model_selection import train_test_split
 import statsmodels.api as sm
 
 from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
@@ -24,83 +36,156 @@ from sklearn.metrics import confusion_matrix
 from sklearn.metrics import roc_auc_score
 from sklearn.metrics import roc_curve
 
+log = logging.getLogger('train')
+
 def z_score(x, mu, sigma):
     return (x - mu) / sigma
 
+def get_predictors(train, exclude=()):
+    '''
+    The predictor columns - everything not in NON_PRED, or exclude.
+    '''
+    excluded = set(st.NON_PRED) | set(exclude)
+    return [p for p in train.columns.tolist() if p not in excluded]
+
 def predict_model(train):
-    predictors = train.columns.tolist()
-    predictors = [p for p in predictors if p not in st.NON_PRED]
+    predictors = get_predictors(train)
     logit = sm.Logit(train[st.TARGET], train[predictors])
     return logit
-    
-def read():
-    train = pd.read_csv(os.path.join(st.DIW_DIR, 'train.csv'))
-    return train
-
-#def main():
-# Get the data
-train = read()
-
-# Map the foreclosure col to binary
-mapping = {True : 1, False : 0}
-train['foreclosure_status'] = train['foreclosure_status'].map(mapping)
-
-s = SMOTEENN()
-
-# Resample
-_np = st.NON_PRED
-_np.append('ltv')
-_np.append('product_type')
-y = train['foreclosure_status'].values
-#x = train.drop(np, axis=1).values
-
-predictors = train.columns.tolist()
-predictors = [p for p in predictors if p not in _np]
-
-x = train[predictors].values
-
-x_resamp, y_resamp = s.fit_sample(x, y)
-#x_resamp = x; y_resamp = y
-x_train, x_test, y_train, y_test = train_test_split(x_resamp, y_resamp
-                                                    ,test_size=0.25
-                                                    ,random_state=0)
 
-#logit = sm.Logit(y, x)
-#results = logit.fit()
-
-model = RandomForestClassifier(n_estimators=200)
-model = model.fit(x_train, y_train)
-predict = model.predict(x_test)
-
-#predict = results.predict(x_test)
-predict_nominal = [1 if x > .5 else 0 for x in predict]
-
-cm = confusion_matrix(y_test, predict).T
-cm = cm.astype('float')/cm.sum(axis=0)
-
-fig, ax = plt.subplots()
-sns.heatmap(cm, annot=True, cmap='Blues');
-ax.set_xlabel('True Label')
-ax.set_ylabel('Predicted Label')
-ax.xaxis.set_label_position('top')
-
-fig.savefig('confusion_matrix')
-
-feat_labels = train[predictors].columns
-importances = model.feature_importances_
-indices = np.argsort(importances)[::-1]
-
-ncomp = 20
-f = sns.barplot(x=feat_labels[indices[:ncomp]], y=importances[indices[:ncomp]], color=sns.xkcd_rgb["pale red"])
-plt.title('Top 10 Feature Importances')
-plt.ylabel('Relative Feature Importance')
-plt.xticks(rotation=90)
-
-f.get_figure().savefig('feature sig')
+def read(filters=None, vintages=None):
+    '''
+    The training data, limited to the vintages, e.g. (2004, 2008), and rows
+    matching filters, e.g. [('property_state', '==', 'CA')]. Only the
+    matching partitions are read.
+    '''
+    train = storage.read('train', filters=t.vintage_filters(vintages, filters))
+    t.report_memory(train, 'Training data')
+    return train
 
-train.groupby(['foreclosure_status'
-              ,pd.cut(train['borrower_credit_score'], np.arange(0, 900, 9))])\
-    .size()\
-    .unstack(0)\
-    .plot.bar(stacked=True)
-    
+def artifact_key(fingerprint, config):
+    sha = hashlib.sha1(fingerprint.encode())
+    sha.update(json.dumps(config, sort_keys=True).encode())
+    sha.update(json.dumps([st.TARGET] + list(st.NON_PRED)).encode())
+    return sha.hexdigest()[:16]
+
+def artifact_path(key):
+    return os.path.join(st.MODEL_DIR, 'model_{}.pkl'.format(key))
+
+def save_artifact(artifact):
+    os.makedirs(st.MODEL_DIR, exist_ok=True)
+    joblib.dump(artifact, artifact_path(artifact['key']))
+    # The key of the last model trained, for scoring
+    with open(os.path.join(st.MODEL_DIR, 'latest.json'), 'w') as f:
+        json.dump({'key' : artifact['key']}, f)
+
+def load_artifact(key=None):
+    '''
+    Load a model artifact, by default the last one trained.
+    '''
+    if key is None:
+        with open(os.path.join(st.MODEL_DIR, 'latest.json'), 'r') as f:
+            key = json.load(f)['key']
+    return joblib.load(artifact_path(key))
+
+def evaluate(model, x_test, y_test):
+    predict = model.predict(x_test)
+    probability = model.predict_proba(x_test)[:, 1]
+    return {
+        'accuracy' : float(np.mean(predict == y_test))
+        ,'roc_auc' : float(roc_auc_score(y_test, probability)) if len(np.unique(y_test)) > 1 else None
+        ,'confusion_matrix' : confusion_matrix(y_test, predict, labels=[0, 1]).tolist()
+        ,'classification_report' : classification_report(y_test, predict, output_dict=True
+                                                         ,zero_division=0)
+    }
+
+def fit(train, config):
+    '''
+    Split, resample, and fit the forest. Only the training split is
+    resampled, so the test split keeps the true class balance. Returns the
+    model pipeline, its predictors, and the metrics on the held out split.
+    '''
+    predictors = get_predictors(train, config['exclude'])
+    y = train[st.TARGET].astype(np.int8).values
+    x = t.predictor_matrix(train, predictors)
+    x_train, x_test, y_train, y_test = train_test_split(x, y
+                                                        ,test_size=config['test_size']
+                                                        ,stratify=y
+                                                        ,random_state=config['random_state'])
+    # The trees are built in parallel, on the configured backend
+    model = resample.pipeline(RandomForestClassifier(n_estimators=config['n_estimators']
+                                                     ,random_state=config['random_state'])
+                              ,config['resample']
+                              ,majority_ratio=config['majority_ratio']
+                              ,k_neighbors=config['k_neighbors']
+                              ,random_state=config['random_state'])
+    with instrument.step('fit', len(y_train), log), m.backend():
+        model = model.fit(x_train, y_train)
+        metrics = evaluate(model, x_test, y_test)
+    metrics['resample'] = model.named_steps['resample'].report_
+    return model, predictors, metrics
+
+@instrument.timed('train', logger=log)
+def train_model(config=None, train=None, force=False, vintages=None):
+    '''
+    Train the model, or load it if one was already trained on the same data,
+    with the same hyperparameters. The model is an imblearn pipeline of the
+    resampler and the forest. config overrides any of MODEL_PARAMS, and
+    train defaults to the training data set. Returns the artifact, a dict of
+    the model, its predictors, config, and metrics. vintages limits the
+    training data read, e.g. to (2004, 2008).
+    '''
+    config = dict(st.MODEL_PARAMS, **(config or {}))
+    if train is None:
+        train = read(vintages=vintages)
+    key = artifact_key(m.data_fingerprint(train), config)
+    if not force and os.path.exists(artifact_path(key)):
+        log.debug('Loading model %s.', key)
+        return load_artifact(key)
+    log.debug('Training model %s - this may take some time...', key)
+    model, predictors, metrics = fit(train, config)
+    artifact = {
+        'key' : key
+        ,'model' : model
+        ,'predictors' : predictors
+        ,'config' : config
+        ,'metrics' : metrics
+        ,'created' : time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+    save_artifact(artifact)
+    log.info('Model %s: accuracy %.4f, ROC AUC %s', key, metrics['accuracy'], metrics['roc_auc'])
+    return artifact
+
+def plot_confusion_matrix(artifact, path='confusion_matrix'):
+    cm = np.array(artifact['metrics']['confusion_matrix']).T
+    cm = cm.astype('float')/cm.sum(axis=0)
+    fig, ax = plt.subplots()
+    sns.heatmap(cm, annot=True, cmap='Blues');
+    ax.set_xlabel('True Label')
+    ax.set_ylabel('Predicted Label')
+    ax.xaxis.set_label_position('top')
+    fig.savefig(path)
+
+def plot_importances(artifact, ncomp=20, path='feature sig'):
+    feat_labels = np.array(artifact['predictors'])
+    importances = artifact['model'].named_steps['model'].feature_importances_
+    indices = np.argsort(importances)[::-1]
+    f = sns.barplot(x=feat_labels[indices[:ncomp]], y=importances[indices[:ncomp]], color=sns.xkcd_rgb["pale red"])
+    plt.title('Top 10 Feature Importances')
+    plt.ylabel('Relative Feature Importance')
+    plt.xticks(rotation=90)
+    f.get_figure().savefig(path)
+
+def plot_credit_scores(train):
+    train.groupby(['foreclosure_status'
+                  ,pd.cut(train['borrower_credit_score'], np.arange(0, 900, 9))])\
+        .size()\
+        .unstack(0)\
+        .plot.bar(stacked=True)
+
+if __name__ == '__main__':
+    train = read()
+    artifact = train_model(train=train)
+    plot_confusion_matrix(artifact)
+    plot_importances(artifact)
+    plot_credit_scores(train)
@@ -12,123 +12,680 @@ import pandas as pd, numpy as np
 import os
 import logging
 import settings as st
+import storage
+import categories
+import impute
+import instrument
+import sampling
 
-def count_performance():
-    fc_counts = {}
-    with open(os.path.join(st.DIW_DIR, 'Performance.csv'), 'r') as f:
-        for i, line in enumerate(f):
-            # header
-            if i == 0:
-                continue
-            lid, date = line.split(',')
-            lid = int(lid)
-            if lid not in fc_counts:
-                fc_counts[lid] = {
-                    'foreclosure_status' : False
-                    ,'performance_count' : 0
-                }
-            # NOTE: This is not the number of pqayments made
-            fc_counts[lid]['performance_count'] += 1
-            if len(date.strip()) > 0:
-                fc_counts[lid]['foreclosure_status'] = True
-    return fc_counts
-
-def get_summary(lid, key, fc_count_dict):
-    summary = fc_count_dict.get(lid, {
-        'foreclosure_status' : False
-        ,'performance_count' : 0
-    })
-    return summary[key]
-
-def write_mapping(mapping):
-    pth = os.path.join(st.CATEGORY_MAPPING_DIR, 'category_map.txt')
-    if os.path.exists(pth):
-        os.remove(pth)
-    with open(pth, 'w') as f:
-        f.write(str(mapping))
-
-def clean_nulls(acquisition):
-    # We assume that the credit score is n/a. Then, we can map these back to
-    # the average credit score, overall. It may be more effective to do apply
-    # groupings to the data, then find the average for a given grouping; 
-    # however, this is is simpler, and effective enough.
-    cols_to_fill = ['borrower_credit_score', 'borrower_count', 'cltv', 'dti']
-    for col in cols_to_fill:
-        acquisition.loc[acquisition[col].isna(), col] = \
-            acquisition[acquisition[col].notna()][col].mean()
+log = logging.getLogger('transform')
+
+# Performance columns the per loan summary is computed from
+PANEL_COLS = ['id', 'loan_age', 'balance', 'delinquency_status', 'modification_flag'
+              ,'foreclosure_date']
+# Performance summary for loans which have no performance records. These are
+# the columns joined onto the acquisition data; None leaves a null.
+SUMMARY_DEFAULTS = {
+    'foreclosure_status' : False
+    ,'performance_count' : 0
+    ,'max_delinquency' : None
+    ,'months_30_dpd' : 0
+    ,'months_60_dpd' : 0
+    ,'months_90_dpd' : 0
+    ,'first_delinquency_age' : None
+    ,'modification_flag' : False
+    ,'last_balance' : None
+}
+SUMMARY_DTYPES = {
+    'foreclosure_status' : 'bool'
+    ,'performance_count' : 'int32'
+    ,'max_delinquency' : 'Int8'
+    ,'months_30_dpd' : 'int16'
+    ,'months_60_dpd' : 'int16'
+    ,'months_90_dpd' : 'int16'
+    ,'first_delinquency_age' : 'Int16'
+    ,'modification_flag' : 'bool'
+    ,'last_age' : 'Int16'
+    ,'last_balance' : 'float32'
+}
+# How loans which span chunks, or partitions, are combined. The last balance
+# is taken from the row with the latest loan age, in combine.
+SUMMARY_AGGREGATIONS = {
+    'foreclosure_status' : 'max'
+    ,'performance_count' : 'sum'
+    ,'max_delinquency' : 'max'
+    ,'months_30_dpd' : 'sum'
+    ,'months_60_dpd' : 'sum'
+    ,'months_90_dpd' : 'sum'
+    ,'first_delinquency_age' : 'min'
+    ,'modification_flag' : 'max'
+}
+
+def _reduce_at(ufunc, codes, values, size, initial):
+    '''
+    ufunc (maximum, or minimum) of values for each code, and whether the code
+    had any values.
+    '''
+    out = np.full(size, initial, dtype=np.float64)
+    ufunc.at(out, codes, values)
+    return out, np.bincount(codes, minlength=size) > 0
+
+def observed(chunk):
+    '''
+    The delinquency (in months past due, with X, unknown, as null), loan age,
+    balance, and modification flag of performance records. Outside the first
+    OBSERVATION_MONTHS of a loan's life, the delinquency and balance are
+    nulled, and the flag cleared, so the history features only describe the
+    observation window, not the run up to the outcome.
+    '''
+    dlq = pd.to_numeric(chunk['delinquency_status'], errors='coerce').values.astype(np.float64)
+    age = chunk['loan_age'].values.astype(np.float64)
+    balance = chunk['balance'].values.astype(np.float64)
+    modified = (chunk['modification_flag'] == 'Y').values
+    if st.OBSERVATION_MONTHS:
+        window = age < st.OBSERVATION_MONTHS
+        dlq = np.where(window, dlq, np.nan)
+        balance = np.where(window, balance, np.nan)
+        modified = modified & window
+    return dlq, age, balance, modified
+
+def summarize(chunk):
+    '''
+    Reduce performance records to one row per loan, with bincount, and
+    ufunc.at, over the factorized loan ids.
+    '''
+    codes, uniques = pd.factorize(chunk['id'].values)
+    n = len(uniques)
+    dlq, age, balance, modified = observed(chunk)
+    known = ~np.isnan(dlq)
+    delinquent = known & (dlq >= 1)
+    max_dlq, any_dlq = _reduce_at(np.maximum, codes[known], dlq[known], n, -1)
+    first_dlq, _ = _reduce_at(np.minimum, codes[delinquent & ~np.isnan(age)]
+                              ,age[delinquent & ~np.isnan(age)], n, np.inf)
+    # The balance at the latest loan age with a balance reported
+    rows = np.flatnonzero(~np.isnan(balance) & ~np.isnan(age))
+    rows = rows[np.lexsort((age[rows], codes[rows]))]
+    last = rows[np.append(codes[rows][1:] != codes[rows][:-1], True)] if len(rows) else rows
+    last_age = np.full(n, np.nan)
+    last_balance = np.full(n, np.nan)
+    last_age[codes[last]] = age[last]
+    last_balance[codes[last]] = balance[last]
+    summary = pd.DataFrame({
+        'foreclosure_status' : np.bincount(codes, weights=chunk['foreclosure_date'].notna().values
+                                           ,minlength=n) > 0
+        # NOTE: This is not the number of payments made
+        ,'performance_count' : np.bincount(codes, minlength=n)
+        ,'max_delinquency' : np.where(any_dlq, max_dlq, np.nan)
+        ,'months_30_dpd' : np.bincount(codes, weights=known & (dlq == 1), minlength=n)
+        ,'months_60_dpd' : np.bincount(codes, weights=known & (dlq == 2), minlength=n)
+        ,'months_90_dpd' : np.bincount(codes, weights=known & (dlq >= 3), minlength=n)
+        ,'first_delinquency_age' : np.where(np.isinf(first_dlq), np.nan, first_dlq)
+        ,'modification_flag' : np.bincount(codes, weights=modified, minlength=n) > 0
+        ,'last_age' : last_age
+        ,'last_balance' : last_balance
+    }, index=pd.Index(uniques, name='id'))
+    return summary.astype(SUMMARY_DTYPES)
+
+def combine(summaries):
+    '''
+    Merge per chunk summaries, for loans which span chunks.
+    '''
+    summary = pd.concat(summaries, axis=0)
+    if not summary.index.has_duplicates:
+        return summary
+    combined = summary.groupby(level=0).agg(SUMMARY_AGGREGATIONS)
+    # last skips nulls, so this is the balance at the latest age reported
+    last = summary[['last_age', 'last_balance']].sort_values('last_age', na_position='first')
+    combined[['last_age', 'last_balance']] = last.groupby(level=0).last()
+    return combined.astype(SUMMARY_DTYPES)
+
+def summarize_sorted(chunk):
+    '''
+    summarize for a chunk sorted by loan id. Each loan's rows are contiguous,
+    so they're reduced with ufunc.reduceat over the group starts, rather than
+    factorizing the ids into a hash table.
+    '''
+    ids = chunk['id'].values
+    if len(ids) == 0:
+        return empty_summary()
+    starts = np.flatnonzero(np.append(True, ids[1:] != ids[:-1]))
+    counts = np.diff(np.append(starts, len(ids)))
+    group = np.repeat(np.arange(len(starts)), counts)
+    dlq, age, balance, modified = observed(chunk)
+    known = ~np.isnan(dlq)
+    delinquent = known & (dlq >= 1)
+    first_dlq = np.minimum.reduceat(np.where(delinquent & ~np.isnan(age), age, np.inf), starts)
+    # The balance at the latest loan age with a balance reported
+    valid = ~np.isnan(balance) & ~np.isnan(age)
+    last_age = np.maximum.reduceat(np.where(valid, age, -np.inf), starts)
+    last = valid & (age == last_age[group])
+    last_balance = np.full(len(starts), np.nan)
+    last_balance[group[last]] = balance[last]
+    last_age[np.isinf(last_age)] = np.nan
+    summary = pd.DataFrame({
+        'foreclosure_status' : np.logical_or.reduceat(chunk['foreclosure_date'].notna().values, starts)
+        # NOTE: This is not the number of payments made
+        ,'performance_count' : counts
+        # fmax skips the nulls, leaving null only for loans with no known status
+        ,'max_delinquency' : np.fmax.reduceat(dlq, starts)
+        ,'months_30_dpd' : np.add.reduceat((known & (dlq == 1)).astype(np.int16), starts)
+        ,'months_60_dpd' : np.add.reduceat((known & (dlq == 2)).astype(np.int16), starts)
+        ,'months_90_dpd' : np.add.reduceat((known & (dlq >= 3)).astype(np.int16), starts)
+        ,'first_delinquency_age' : np.where(np.isinf(first_dlq), np.nan, first_dlq)
+        ,'modification_flag' : np.logical_or.reduceat(modified, starts)
+        ,'last_age' : last_age
+        ,'last_balance' : last_balance
+    }, index=pd.Index(ids[starts], name='id'))
+    return summary.astype(SUMMARY_DTYPES)
+
+def empty_summary():
+    return summarize(pd.DataFrame({c : pd.Series([], dtype=st.DTYPES['Performance'][c])
+                                   for c in PANEL_COLS}))
+
+def summary_name():
+    # Summaries over different observation windows are kept apart
+    if st.OBSERVATION_MONTHS:
+        return 'performance_summary_%dm' % st.OBSERVATION_MONTHS
+    return 'performance_summary'
+
+def partition_summary(partition, chunksize=None, incremental=None):
+    '''
+    Per loan summary of a single Performance partition, streamed in chunks.
+    Summaries are kept in the performance_summary dataset, and when running
+    incrementally, only recomputed for partitions ingested since.
+    '''
+    if incremental is None:
+        incremental = st.INCREMENTAL
+    if incremental and storage.is_current(summary_name(), partition, 'Performance'):
+        summary = storage.read(summary_name(), partitions=[partition]).set_index('id')
+        # Summaries written before a feature was added are recomputed
+        if set(SUMMARY_DTYPES) <= set(summary.columns):
+            return summary
+    log.debug('Summarizing performance for %s.', partition)
+    summaries = []
+    for _, chunk in storage.iter_chunks('Performance', columns=PANEL_COLS
+                                        ,partitions=[partition], chunksize=chunksize):
+        summaries.append(summarize(chunk))
+    summary = combine(summaries) if len(summaries) else empty_summary()
+    storage.write(summary.reset_index(), summary_name(), partition=partition)
+    return summary
+
+@instrument.timed(logger=log)
+def count_performance(chunksize=None, incremental=None):
+    '''
+    Compute the foreclosure status, number of performance records, and the
+    delinquency, modification, and balance history features for each loan.
+    The performance data is streamed in chunks, and reduced one partition at
+    a time. Returns a frame indexed by loan id.
+    '''
+    partitions = [partition_summary(p, chunksize, incremental)
+                  for p in storage.list_partitions('Performance')]
+    if len(partitions) == 0:
+        return empty_summary()
+    return combine(partitions)
+
+def attach_summary(acquisition, counts):
+    '''
+    Join the performance summary onto the acquisition frame, by loan id, in a
+    single reindex. Loans without performance records get the defaults.
+    '''
+    summary = counts.reindex(acquisition['id'].values)
+    for key, default in SUMMARY_DEFAULTS.items():
+        values = summary[key] if default is None else summary[key].fillna(default)
+        acquisition[key] = values.astype(counts[key].dtype).values
     return acquisition
 
-def transform(acquisition, counts):
-    # Add the foreclosure status column to the acquisition df
-    if st._DEBUG: print('[+] Adding foreclosure counts to acquisition data.');
-    acquisition['foreclosure_status'] = \
-        acquisition['id'].apply(lambda x: get_summary(x, 'foreclosure_status'
-                                                     ,counts))
-    # Add the performance count column to the acquisition df
-    acquisition['performance_count'] = \
-        acquisition['id'].apply(lambda x: get_summary(x, 'performance_count'
-                                                     ,counts))
-    
-    # Cast a subset of columns to numeric category codes
-    cols = ["channel","seller","first_time_homebuyer"
-            ,"loan_purpose","property_type","occupancy_status"
-            ,"property_state","product_type"]
-    if st._DEBUG: print('[+] Beginning type casting.');
-    parent_mapping = {}
-    for col in cols:
-        if st._DEBUG: print('\t[+] Type casting %s.' % col);
-        ct = acquisition[col].astype('category').cat
-        mapping = {k : v for k, v in zip(ct.codes, ct.categories)}
-        parent_mapping[col] = mapping
-        acquisition[col] = ct.codes
+def clean_nulls(acquisition, stats=None):
+    # Nulls are filled from the statistics in impute, using the strategy in
+    # settings.IMPUTE_STRATEGY - the overall mean or median, or the mean for
+    # the loan's state and purpose. Unless the caller passes statistics, they
+    # are computed from this frame, and persisted for later partitions and
+    # scoring.
+    if stats is None:
+        stats = impute.compute([acquisition])
+        impute.save(stats)
+    return impute.apply(acquisition, stats)
+
+# Parsed (month, year) pairs, keyed by the raw date string. Dates repeat
+# heavily within a quarter, so each one is only parsed once per process.
+_DATE_CACHE = {}
+
+def parse_date(value):
+    '''
+    (month, year) of a MM/YYYY date. The fixed format is sliced, and anything
+    else falls back to splitting on the slash.
+    '''
+    if len(value) == 7 and value[2] == '/':
+        return int(value[:2]), int(value[3:])
+    parts = value.split('/')
+    return int(parts[0]), int(parts[-1])
+
+def split_dates(series):
+    '''
+    Decompose a MM/YYYY column into nullable int16 month and year arrays. Only
+    the distinct values are parsed, and the results are spread back over the
+    rows by category code.
+    '''
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype('category')
+    parsed = []
+    for value in series.cat.categories:
+        if value not in _DATE_CACHE:
+            _DATE_CACHE[value] = parse_date(str(value))
+        parsed.append(_DATE_CACHE[value])
+    # The trailing zeros are picked up by the null codes (-1), then masked
+    lookup = np.array(parsed + [(0, 0)], dtype=np.int16).reshape(-1, 2)
+    codes = series.cat.codes.values
+    mask = codes < 0
+    month = pd.arrays.IntegerArray(lookup[codes, 0], mask)
+    year = pd.arrays.IntegerArray(lookup[codes, 1], mask.copy())
+    return month, year
+
+def months_since_epoch(month, year):
+    return ((year - 1970) * 12 + (month - 1)).astype('Int16')
+
+def compact(frame, dtypes):
+    '''
+    Cast the columns of a frame to the compact types in dtypes.
+    '''
+    return frame.astype({c : t for c, t in dtypes.items() if c in frame.columns})
+
+def report_memory(frame, stage):
+    # Measuring the strings is slow, so only done when it will be logged
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug('%s: %d rows, %.1f MB', stage, len(frame)
+                  ,frame.memory_usage(deep=True).sum() / 2**20)
+
+def predictor_matrix(frame, predictors, na_value=-1):
+    '''
+    The predictors as a float32 matrix for the models. Nulls are kept as nulls
+    in the data sets, and only mapped to na_value here.
+    '''
+    return frame[predictors].to_numpy(dtype=np.float32, na_value=na_value)
+
+def features(acquisition, store=None, stats=None):
+    '''
+    Turn acquisition records into model features. Shared by the transform,
+    and by scoring, which passes the persisted store and statistics.
+    '''
+    rows = len(acquisition)
+    # Fill missing values. This happens before the type casting, since the
+    # grouped fills are keyed on the raw state and purpose values. The
+    # remaining nulls are kept in the nullable types, and only flagged with
+    # -1 when handed to a model.
+    with instrument.step('clean_nulls', rows, log):
+        acquisition = clean_nulls(acquisition, stats)
     
-    if st._DEBUG: print('[+] Writing category mapping.')
-    write_mapping(parent_mapping)
+    # Cast a subset of columns to numeric category codes. The codes come from
+    # the persistent store, so they are stable from run to run.
+    with instrument.step('encode_categories', rows, log):
+        if store is None:
+            store = categories.load()
+            if categories.update(store, acquisition, st.CATEGORY_COLS):
+                log.debug('Writing category mapping.')
+                categories.save(store)
+        for col in st.CATEGORY_COLS:
+            log.debug('Type casting %s.', col)
+            acquisition[col] = categories.encode(store, acquisition[col], col)
         
     # Convert date values...
     dates = ['first_payment','origination']
-    # for each of the date columns... 
-    for date in dates:
-        # create the name of the column
-        col = '{}_date'.format(date)
-        if st._DEBUG: print('\t[+] Type casting %s.' % col);
-        # Add a month for the date
-        acquisition['{}_month'.format(date)] = pd.to_numeric(acquisition[col].str.split('/').str.get(0))
-        # Add a year for the date
-        acquisition['{}_year'.format(date)] = pd.to_numeric(acquisition[col].str.split('/').str.get(1))
+    with instrument.step('split_dates', rows, log):
+        # for each of the date columns... 
+        for date in dates:
+            # create the name of the column
+            col = '{}_date'.format(date)
+            log.debug('Type casting %s.', col)
+            month, year = split_dates(acquisition[col])
+            if st.DATE_ENCODING == 'months':
+                # A single months since epoch column
+                acquisition['{}_months'.format(date)] = months_since_epoch(month, year)
+            else:
+                # Add a month, and a year for the date
+                acquisition['{}_month'.format(date)] = month
+                acquisition['{}_year'.format(date)] = year
         
     # These columns will make things difficult, and we don't really need them
-    acquisition = acquisition.drop(st.DROP_COLS,1)
-
-    # Fill missing values, and retain only records which have been in the data
-    # set for a predefined number of quarters. For most fields, we flag nulls
-    # with -1. However, we are working to expand this, so that we fill those 
-    # nulls with a tad more intellect.
-    if st._DEBUG: print('[+] Filling nulls');
-    acquisition = clean_nulls(acquisition)
-    acquisition = acquisition.fillna(-1)
+    return acquisition.drop(st.DROP_COLS, axis=1)
+
+def sample_fraction():
+    # A row cap is spread over the vintages in proportion to their loans
+    return sampling.fraction(storage.row_count('Acquisition') if st.SAMPLE_ROWS else None)
+
+def sample_loans(acquisition, share):
+    '''
+    The development sample of the loans, stratified on the foreclosure status
+    and vintage, so it comes after the summaries are attached.
+    '''
+    if share >= 1.0:
+        return acquisition
+    with instrument.step('sample', len(acquisition), log) as record:
+        acquisition = sampling.stratified(acquisition, share)
+        record.rows_out = len(acquisition)
+    return acquisition
+
+def transform(acquisition, counts, store=None, stats=None, share=1.0):
+    # Add the foreclosure status, and performance count columns to the
+    # acquisition df
+    rows = len(acquisition)
+    with instrument.step('attach_summary', rows, log):
+        acquisition = attach_summary(acquisition, counts)
+
+    if stats is None and share < 1.0:
+        # The fill statistics are persisted for scoring, so they come from
+        # every loan, not the sample
+        stats = impute.compute([acquisition])
+        impute.save(stats)
+    acquisition = sample_loans(acquisition, share)
+    acquisition = features(acquisition, store, stats)
+    return drop_short_lived(acquisition)
+
+def drop_short_lived(acquisition):
+    # Retain only records which have been in the data set for a predefined
+    # number of quarters.
     # Remove loans not in the dataset for four periods
-    if st._DEBUG: print('[+] Dropping short lived values.')
-    acquisition = acquisition[acquisition['performance_count'] > st.MINIMUM_QUARTER_COUNT]
-    
+    with instrument.step('drop_short_lived', len(acquisition), log) as record:
+        acquisition = acquisition[acquisition['performance_count'] > st.MINIMUM_QUARTER_COUNT]
+        record.rows_out = len(acquisition)
     return acquisition
 
-def read():
-    acquisition = pd.read_csv(os.path.join(st.DIW_DIR, 'Acquisition.csv'))
+def vintage_range(vintages):
+    '''
+    The (first, last) acquisition quarters of vintages - a quarter or year,
+    or a (first, last) pair of them, e.g. (2004, 2008) for 2004Q1 to 2008Q4.
+    '''
+    if isinstance(vintages, (str, int)):
+        vintages = (vintages, vintages)
+    first, last = [str(v) for v in vintages]
+    return (first + 'Q1' if len(first) == 4 else first
+            ,last + 'Q4' if len(last) == 4 else last)
+
+def in_vintages(partition, vintages):
+    first, last = vintage_range(vintages)
+    return first <= partition <= last
+
+def encode_filter(store, col, op, value):
+    '''
+    A filter on the training data, where the category columns hold codes:
+    string values of those columns are mapped to their codes.
+    '''
+    if col not in st.CATEGORY_COLS:
+        return (col, op, value)
+    known = {v : i for i, v in enumerate(store['columns'].get(col, []))}
+    many = op in ('in', 'not in')
+    codes = []
+    for v in (value if many else [value]):
+        if isinstance(v, str):
+            if v not in known:
+                raise ValueError('Unknown value {} for {}, which holds category codes in '
+                                 'the training data.'.format(v, col))
+            v = known[v]
+        codes.append(v)
+    return (col, op, codes if many else codes[0])
+
+def vintage_filters(vintages=None, filters=None):
+    '''
+    The filters on the training data, plus those limiting it to the vintages,
+    if any. Values of the category columns may be given as strings, e.g.
+    [('property_state', '==', 'CA')], and are mapped to their codes.
+    '''
+    store = categories.load() if filters else None
+    filters = [encode_filter(store, *f) for f in filters or []]
+    if vintages is not None:
+        first, last = vintage_range(vintages)
+        filters += [(st.VINTAGE, '>=', first), (st.VINTAGE, '<=', last)]
+    return filters or None
+
+def tag_vintage(frame, partition):
+    # The vintage is the quarter of the acquisition file the loan was in, which
+    # the acquisition and performance partitions are named by - not the
+    # quarter of its origination_date
+    frame[st.VINTAGE] = partition
+    return frame
+
+@instrument.timed(logger=log)
+def read(filters=None):
+    '''
+    The acquisition data, limited to the rows matching filters, e.g.
+    [('property_state', '==', 'CA')]. Partitions the filters rule out aren't
+    opened.
+    '''
+    partitions = storage.prune('Acquisition', filters=filters)
+    acquisition = pd.concat([tag_vintage(storage.read('Acquisition', partitions=[p], filters=filters), p)
+                             for p in partitions]
+                            ,axis=0, ignore_index=True)
+    acquisition = compact(acquisition, st.COMPACT_DTYPES['Acquisition'])
+    report_memory(acquisition, 'Acquisition')
     return acquisition
 
 def write(acquisition):
-    acquisition.to_csv(os.path.join(st.DIW_DIR, 'train.csv'), index=False)
-    
-def perform_xform():
-    if st._DEBUG: print('[+] Reading acquisition file.');
+    '''
+    Write the training data, one partition per vintage.
+    '''
+    storage.remove('train')
+    for vintage, frame in acquisition.groupby(st.VINTAGE, sort=True):
+        storage.write(frame, 'train', partition=vintage)
+    storage.finalize('train')
+    if st.EXPORT_CSV:
+        storage.export_csv('train')
+
+@instrument.timed(logger=log)
+def scan_acquisition(chunksize=None):
+    '''
+    Streaming pass over the acquisition data, computing everything which must
+    be global before the partitions are transformed independently: the
+    category codes, and the statistics used to fill nulls. Both are persisted.
+    '''
+    store = categories.load()
+    changed = False
+    fill_statistics = impute.FillStatistics()
+    for _, chunk in storage.iter_chunks('Acquisition', chunksize=chunksize):
+        changed = categories.update(store, chunk, st.CATEGORY_COLS) or changed
+        fill_statistics.update(chunk)
+    if changed:
+        log.debug('Writing category mapping.')
+        categories.save(store)
+    stats = fill_statistics.finish()
+    impute.save(stats)
+    return store, stats
+
+def bucket_name(name, bucket):
+    return os.path.join('xform', name, '%03d' % bucket)
+
+def scatter(frame, name, piece, buckets):
+    '''
+    Hash partition a frame by loan id. Each bucket's rows are written as a
+    piece of the xform/<name>/<bucket> dataset.
+    '''
+    keys = frame['id'].values % buckets
+    order = np.argsort(keys, kind='stable')
+    bounds = np.searchsorted(keys[order], np.arange(buckets + 1))
+    for bucket in range(buckets):
+        rows = order[bounds[bucket]:bounds[bucket + 1]]
+        if len(rows):
+            # Scratch data, read back whole, so no partition statistics
+            storage.write(frame.iloc[rows], bucket_name(name, bucket), partition=piece, stats=False)
+
+def perform_xform_partitioned(buckets=None, chunksize=None):
+    '''
+    Out of core transform. Both the acquisition data and the per loan
+    performance summaries are hash partitioned by loan id, and each bucket is
+    transformed on its own, so peak memory follows the bucket size rather
+    than the dataset. The output is one train partition per vintage and
+    bucket, <vintage>_<bucket>.
+    '''
+    buckets = buckets or st.XFORM_PARTITIONS
+    storage.remove('xform')
+    store, stats = scan_acquisition(chunksize)
+    share = sample_fraction()
+    with instrument.step('scatter_acquisition', logger=log) as record:
+        record.rows_in = 0
+        for i, (partition, chunk) in enumerate(storage.iter_chunks('Acquisition', chunksize=chunksize)):
+            scatter(tag_vintage(chunk, partition), 'Acquisition', '{}_{}'.format(partition, i)
+                    ,buckets)
+            record.rows_in += len(chunk)
+    with instrument.step('scatter_performance', logger=log):
+        for partition in storage.list_partitions('Performance'):
+            scatter(partition_summary(partition, chunksize).reset_index()
+                    ,'performance_summary', partition, buckets)
+    storage.remove('train')
+    for bucket in range(buckets):
+        if not storage.exists(bucket_name('Acquisition', bucket)):
+            continue
+        log.debug('Transforming partition %d of %d.', bucket + 1, buckets)
+        acquisition = compact(storage.read(bucket_name('Acquisition', bucket))
+                              ,st.COMPACT_DTYPES['Acquisition'])
+        if storage.exists(bucket_name('performance_summary', bucket)):
+            # A loan may be in several Performance partitions, so several pieces
+            counts = combine([storage.read(bucket_name('performance_summary', bucket)).set_index('id')])
+        else:
+            counts = empty_summary()
+        with instrument.step('bucket_%03d' % bucket, len(acquisition), log) as record:
+            acquisition = transform(acquisition, counts, store=store, stats=stats, share=share)
+            record.rows_out = len(acquisition)
+        for vintage, frame in acquisition.groupby(st.VINTAGE, sort=True):
+            storage.write(frame, 'train', partition='%s_%03d' % (vintage, bucket))
+    storage.remove('xform')
+    storage.finalize('train')
+    if st.EXPORT_CSV:
+        storage.export_csv('train')
+
+def is_sorted(name, partition, chunksize=None):
+    '''
+    Whether a partition is sorted by loan id, checked a chunk of ids at a time.
+    '''
+    previous = None
+    for _, chunk in storage.iter_chunks(name, columns=['id'], partitions=[partition]
+                                        ,chunksize=chunksize):
+        ids = chunk['id'].values
+        if len(ids) == 0:
+            continue
+        if np.any(ids[1:] < ids[:-1]) or (previous is not None and ids[0] < previous):
+            return False
+        previous = ids[-1]
+    return True
+
+def sorted_summaries(partition, chunksize=None):
+    '''
+    Yield the summaries of a performance partition sorted by loan id, in id
+    order. The last loan of each chunk may continue into the next, so it's
+    held back and merged, and each loan is yielded once, complete.
+    '''
+    carry = None
+    for _, chunk in storage.iter_chunks('Performance', columns=PANEL_COLS
+                                        ,partitions=[partition], chunksize=chunksize):
+        summary = summarize_sorted(chunk)
+        if len(summary) == 0:
+            continue
+        if carry is not None:
+            if summary.index[0] == carry.index[0]:
+                summary = pd.concat([combine([carry, summary.iloc[:1]]), summary.iloc[1:]])
+            else:
+                summary = pd.concat([carry, summary])
+        carry = summary.iloc[-1:]
+        if len(summary) > 1:
+            yield summary.iloc[:-1]
+    if carry is not None:
+        yield carry
+
+def attach_sorted(acquisition, summaries):
+    '''
+    Merge join a stream of summaries onto acquisition data, both sorted by
+    loan id. Each summary's rows are located with a binary search over the
+    sorted ids. Loans without performance records get the defaults.
+    '''
+    ids = acquisition['id'].values
+    columns = {}
+    for key, default in SUMMARY_DEFAULTS.items():
+        dtype = SUMMARY_DTYPES[key]
+        columns[key] = pd.Series(default, index=acquisition.index, dtype=dtype).array.copy()
+    for summary in summaries:
+        keys = summary.index.values
+        pos = np.searchsorted(ids, keys)
+        matched = pos < len(ids)
+        matched[matched] = ids[pos[matched]] == keys[matched]
+        for key in SUMMARY_DEFAULTS:
+            columns[key][pos[matched]] = summary[key].array[matched]
+    for key, values in columns.items():
+        acquisition[key] = values
+    return acquisition
+
+@instrument.timed(logger=log)
+def perform_xform_sorted(chunksize=None, vintages=None):
+    '''
+    Transform each quarter with a merge join. Acquisition and performance
+    partitions of the same quarter are joined in loan id order, streaming the
+    performance data, so memory follows the quarter's acquisition data rather
+    than the number of loans overall, and no hash table of ids is built.
+    Partitions not sorted by id are sorted (acquisition), or reported and
+    joined by hash (performance); ingesting with JOIN_MODE set to sorted
+    writes them sorted. With vintages, only those quarters are transformed,
+    and the other train partitions are left as they are - only their
+    acquisition data is read, and the persisted category codes and fill
+    statistics are reused.
+    '''
+    if vintages is None or not os.path.exists(impute.path()):
+        store, stats = scan_acquisition(chunksize)
+    else:
+        # Only the vintages' partitions are read - the codes and fill
+        # statistics are those persisted by the last full transform
+        store, stats = categories.load(), impute.load()
+    share = sample_fraction()
+    performance = set(storage.list_partitions('Performance'))
+    partitions = storage.list_partitions('Acquisition')
+    if vintages is None:
+        storage.remove('train')
+    else:
+        partitions = [p for p in partitions if in_vintages(p, vintages)]
+    for partition in partitions:
+        acquisition = compact(storage.read('Acquisition', partitions=[partition])
+                              ,st.COMPACT_DTYPES['Acquisition'])
+        acquisition = tag_vintage(acquisition, partition)
+        if vintages is not None and categories.update(store, acquisition, st.CATEGORY_COLS):
+            log.debug('Writing category mapping.')
+            categories.save(store)
+        if not acquisition['id'].is_monotonic_increasing:
+            acquisition = acquisition.sort_values('id', kind='stable').reset_index(drop=True)
+        with instrument.step('join_%s' % partition, len(acquisition), log) as record:
+            if partition not in performance:
+                acquisition = attach_summary(acquisition, empty_summary())
+            elif is_sorted('Performance', partition, chunksize):
+                acquisition = attach_sorted(acquisition, sorted_summaries(partition, chunksize))
+            else:
+                log.warning('Performance partition %s is not sorted by id, joining by hash.'
+                            ,partition)
+                acquisition = attach_summary(acquisition, partition_summary(partition, chunksize))
+            acquisition = sample_loans(acquisition, share)
+            acquisition = drop_short_lived(features(acquisition, store, stats))
+            record.rows_out = len(acquisition)
+        # The vintage may have been written by the partitioned transform, as
+        # <vintage>_<bucket> partitions
+        for stale in storage.list_partitions('train'):
+            if stale.startswith(partition + '_'):
+                storage.remove_partition('train', stale)
+        storage.write(acquisition, 'train', partition=partition)
+    storage.finalize('train')
+    if st.EXPORT_CSV:
+        storage.export_csv('train')
+
+@instrument.timed('transform', logger=log)
+def perform_xform(vintages=None):
+    '''
+    Build the training data. vintages reruns only those quarters, which needs
+    the per quarter transform of JOIN_MODE sorted.
+    '''
+    if st.JOIN_MODE == 'sorted':
+        return perform_xform_sorted(vintages=vintages)
+    if vintages is not None:
+        raise ValueError('Transforming a subset of the vintages needs JOIN_MODE sorted')
+    if st.XFORM_PARTITIONS:
+        return perform_xform_partitioned()
     acquisition = read()
-    if st._DEBUG: print('[+] Computing foreclosure data.');
     counts = count_performance()
-    if st._DEBUG: print('[+] Beginning transformation.');
-    acquisition = transform(acquisition, counts)
-    if st._DEBUG: print('[+] Writing training file.');
-    write(acquisition)
+    acquisition = transform(acquisition, counts, share=sample_fraction())
+    report_memory(acquisition, 'Training data')
+    with instrument.step('write', len(acquisition), log):
+        write(acquisition)
     
 if __name__ == '__main__':
     perform_xform()
@@ -9,10 +9,11 @@ import pandas as pd, numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import settings as st
-import os
+import storage
+import transform as t
 
-def read():
-    data = pd.read_csv(os.path.join(st.DIW_DIR, 'train.csv'))
+def read(filters=None, vintages=None):
+    data = storage.read('train', filters=t.vintage_filters(vintages, filters))
     return data
 
 data = read()
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 21:12:40 2026
+
+@author: dgill
+@description: The pipeline's modules are flat scripts importing each other by
+              name, so packages/ is put on the path. Every path the pipeline
+              writes to is moved into a temporary directory for each test.
+"""
+
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'packages'))
+
+import settings as st
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    for name, sub in [('DATA_DIR', 'landing')
+                      ,('DIW_DIR', 'diw')
+                      ,('CATEGORY_MAPPING_DIR', 'category_mappings')
+                      ,('IMPUTATION_DIR', 'imputation')
+                      ,('FEATURE_SELECTION_DIR', 'feature_selection')
+                      ,('MODEL_DIR', 'models')
+                      ,('BENCHMARK_DIR', 'benchmarks')]:
+        monkeypatch.setattr(st, name, str(tmp_path / sub))
+    monkeypatch.setattr(st, 'LOG_FILE', str(tmp_path / 'pipeline.log'))
+    monkeypatch.setattr(st, 'TRACE_FILE', None)
+    monkeypatch.setattr(st, '_DEBUG', False)
+    return tmp_path
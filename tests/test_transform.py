@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 21:14:05 2026
+
+@author: dgill
+@description: The hash, partitioned and sorted transforms build the same
+              training data, on generated loans, in every DIW format.
+"""
+
+import pandas as pd
+import pytest
+import settings as st
+import generate
+import extract
+import storage
+import transform as t
+
+@pytest.mark.parametrize('fmt', ['parquet', 'feather', 'csv', 'sqlite'])
+def test_join_modes_agree(workdir, monkeypatch, fmt):
+    monkeypatch.setattr(st, 'DIW_FORMAT', fmt)
+    # Not a multiple of any loan's record count, so the chunks end inside loans
+    monkeypatch.setattr(st, 'CHUNK_SIZE', 777)
+    monkeypatch.setattr(st, 'INGEST_WORKERS', 2)
+    monkeypatch.setattr(st, 'SAMPLE_FRACTION', 1.0)
+    monkeypatch.setattr(st, 'SAMPLE_ROWS', 0)
+    generate.generate(st.DATA_DIR, loans=300, count=3, foreclosure_rate=0.1)
+    # Sorted partitions, which every mode can read
+    monkeypatch.setattr(st, 'JOIN_MODE', 'sorted')
+    assert extract.f_concat('Acquisition', stream=True, incremental=False)
+    assert extract.f_concat('Performance', stream=True, incremental=False)
+
+    results = {}
+    for mode, join_mode, buckets in [('hash', 'hash', 0)
+                                     ,('partitioned', 'hash', 3)
+                                     ,('sorted', 'sorted', 0)]:
+        monkeypatch.setattr(st, 'JOIN_MODE', join_mode)
+        monkeypatch.setattr(st, 'XFORM_PARTITIONS', buckets)
+        t.perform_xform()
+        results[mode] = storage.read('train').sort_values('id').reset_index(drop=True)
+
+    assert len(results['hash']) > 0
+    assert results['hash']['performance_count'].sum() > 0
+    for mode in ['partitioned', 'sorted']:
+        pd.testing.assert_frame_equal(results['hash'], results[mode], obj=mode)